@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Beacon that watches the health of Nexus 3
+
+Reads blob store fill levels, task results and repository status with a single
+call to nexus3.health every interval.  Events are only fired when a condition
+starts or stops, not on every interval, so a full blob store is reported once
+when it crosses the threshold and once more when it drops below it again.
+
+:depends: the nexus3 execution module
+
+:configuration: Example beacon configuration on the Nexus minion:
+
+    beacons:
+      nexus3:
+        - interval: 300
+        - blobstore_full: 85
+        - task_failed: True
+        - proxy_blocked: True
+        - repository_offline: True
+
+A Nexus node configured as a connection profile is watched by giving the
+profile name, see the nexus3 state module:
+
+    beacons:
+      nexus3:
+        - interval: 300
+        - profile: eu
+
+Events are fired with these tags and the state alert or clear in the data:
+
+    salt/beacon/<minion id>/nexus3/blobstore/full
+    salt/beacon/<minion id>/nexus3/task/failed
+    salt/beacon/<minion id>/nexus3/proxy/blocked
+    salt/beacon/<minion id>/nexus3/repository/offline
+"""
+import logging
+
+import salt.exceptions
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = 'nexus3'
+
+DEFAULTS = {'blobstore_full': 85,
+            'task_failed': True,
+            'proxy_blocked': True,
+            'repository_offline': True,
+            'profile': None}
+
+
+def __virtual__():
+    return __virtualname__
+
+
+def _merge_config(config):
+    """
+    Merges the beacon configuration list into a dict with the defaults.
+    Returns None if the configuration is not a list of dicts
+    """
+    _config = dict(DEFAULTS)
+    try:
+        for item in config:
+            _config.update(item)
+    except (TypeError, ValueError):
+        return None
+    return _config
+
+
+def validate(config):
+    """
+    Validate the beacon configuration
+    """
+    if not isinstance(config, list):
+        return False, 'Configuration for nexus3 beacon must be a list.'
+
+    _config = _merge_config(config)
+    if _config is None:
+        return False, 'Configuration for nexus3 beacon must be a list of dicts.'
+
+    threshold = _config['blobstore_full']
+    if threshold is not False and not (isinstance(threshold, (int, float)) and 0 < threshold <= 100):
+        return False, 'blobstore_full for nexus3 beacon must be a percentage or False.'
+
+    return True, 'Valid beacon configuration'
+
+
+def _conditions(health, config):
+    """
+    Returns the active conditions keyed by (tag, resource) with the event data.
+    Failed tasks carry the start of the failed run, so a new failure of a task
+    that already failed is reported again
+    """
+    conditions = {}
+
+    if config['blobstore_full'] is not False:
+        for name, metrics in health['blob_stores'].items():
+            used_percent = metrics['used_percent']
+            if used_percent is not None and used_percent > config['blobstore_full']:
+                conditions[('blobstore/full', name)] = {'blob_store': name,
+                                                         'used_percent': round(used_percent, 1),
+                                                         'threshold': config['blobstore_full']}
+
+    if config['task_failed']:
+        for name, info in health['tasks'].items():
+            if info['last_run_result'] not in (None, 'OK', 'CANCELED'):
+                conditions[('task/failed', name)] = {'task': name,
+                                                      'type_id': info['type_id'],
+                                                      'last_run_result': info['last_run_result'],
+                                                      'last_run_started': info['last_run_started']}
+
+    for name, info in health['repositories'].items():
+        if config['proxy_blocked'] and info['remote_status'] == 'AUTO_BLOCKED_UNAVAILABLE':
+            conditions[('proxy/blocked', name)] = {'repository': name,
+                                                   'remote_status': info['remote_status']}
+        if config['repository_offline'] and not info['online']:
+            conditions[('repository/offline', name)] = {'repository': name}
+
+    return conditions
+
+
+def beacon(config):
+    """
+    Fire events for Nexus 3 conditions that started or stopped since the last interval
+
+    .. code-block:: yaml
+
+        beacons:
+          nexus3:
+            - interval: 300
+            - blobstore_full: 90
+    """
+    _config = _merge_config(config)
+    try:
+        health = __salt__['nexus3.health'](profile=_config['profile'])
+    except salt.exceptions.CommandExecutionError as err:
+        log.warning('nexus3 beacon could not read the health of Nexus: {0}'.format(err))
+        return []
+    if health is None:
+        log.warning('nexus3 beacon could not read the health of Nexus')
+        return []
+
+    current = _conditions(health, _config)
+    previous = __context__.get('nexus3.conditions', {})
+    __context__['nexus3.conditions'] = current
+
+    events = []
+    for key, data in current.items():
+        started = key not in previous
+        if key[0] == 'task/failed' and not started:
+            started = previous[key]['last_run_started'] != data['last_run_started']
+        if started:
+            event = dict(data)
+            event.update({'tag': key[0], 'state': 'alert'})
+            events.append(event)
+
+    for key, data in previous.items():
+        if key not in current:
+            event = dict(data)
+            event.update({'tag': key[0], 'state': 'clear'})
+            events.append(event)
+
+    return events
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Salt engine that receives Nexus 3 webhooks and fires them as Salt events
+
+Nexus posts webhooks for repository and audit events to a small HTTP
+receiver run by this engine.  The signature of every request is checked
+against the shared secret before the payload is fired on the event bus,
+so reactors can respond to uploads as they happen instead of polling
+the REST API.
+
+Register the receiver with Nexus using the nexus3.webhook state.
+
+:configuration: Example engine configuration in the master or minion config.
+    A secret is required.  The receiver listens on 127.0.0.1 unless another
+    address is configured, i.e. when Nexus runs on a different host:
+
+    engines:
+      - nexus3_webhook:
+          port: 8765
+          secret: 'shared-webhook-secret'
+
+Events are fired with the webhook id and action as tag, for audit webhooks
+the action is the audit type, for example:
+
+    nexus3/repository/component/created
+    nexus3/repository/asset/deleted
+    nexus3/global/repository/updated
+    nexus3/global/audit/created
+
+The event data is the webhook payload, with the node that sent it added
+as nexus_node.  A reactor promoting new releases might look like:
+
+    reactor:
+      - 'nexus3/repository/component/created':
+        - /srv/reactor/nexus3-promote.sls
+"""
+import hashlib
+import hmac
+import json
+import logging
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import salt.utils.event
+
+log = logging.getLogger(__name__)
+
+# Nexus sends the HMAC-SHA1 of the body, keyed with the webhook secret, in this header
+SIGNATURE_HEADER = 'X-Nexus-Webhook-Signature'
+WEBHOOK_ID_HEADER = 'X-Nexus-Webhook-Id'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _event_tag(webhook_id, payload):
+    """
+    Returns the event tag for a webhook, i.e. rm:repository:component
+    with action CREATED becomes nexus3/repository/component/created.
+    Audit webhooks carry their action as type of the audit entry
+    """
+    action = payload.get('action')
+    if action is None and isinstance(payload.get('audit'), dict):
+        action = payload['audit'].get('type')
+    parts = [part for part in (webhook_id or 'unknown').split(':') if part != 'rm']
+    if action:
+        parts.append(action.lower())
+    return 'nexus3/{0}'.format('/'.join(parts))
+
+
+def _valid_signature(secret, body, signature):
+    """
+    Checks the HMAC-SHA1 signature Nexus sent with the body
+    """
+    if not signature:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _handler(fire, secret, path, max_body):
+    """
+    Returns the request handler class for the webhook receiver
+    """
+    class WebhookHandler(BaseHTTPRequestHandler):
+
+        def _reply(self, code):
+            self.send_response(code)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            if self.path.split('?')[0].rstrip('/') != path.rstrip('/'):
+                self._reply(404)
+                return
+
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > max_body:
+                log.warning('Rejected Nexus3 webhook of {0} bytes from {1}'.format(length, self.client_address[0]))
+                self._reply(413)
+                return
+
+            body = self.rfile.read(length)
+            if not _valid_signature(secret, body, self.headers.get(SIGNATURE_HEADER)):
+                log.warning('Rejected Nexus3 webhook with invalid signature from {0}'.format(self.client_address[0]))
+                self._reply(403)
+                return
+
+            try:
+                payload = json.loads(body.decode('utf-8'))
+            except ValueError:
+                self._reply(400)
+                return
+            if not isinstance(payload, dict):
+                self._reply(400)
+                return
+
+            payload['nexus_node'] = self.client_address[0]
+            tag = _event_tag(self.headers.get(WEBHOOK_ID_HEADER), payload)
+            fire(payload, tag)
+            self._reply(204)
+
+        def log_message(self, format, *args):
+            log.debug('Nexus3 webhook: ' + format, *args)
+
+    return WebhookHandler
+
+
+def start(address='127.0.0.1',
+          port=8765,
+          secret=None,
+          path='/nexus3',
+          max_body=1048576):
+    """
+    Run the webhook receiver
+
+    Args:
+        address (str):
+            Optional: Address to listen on (default='127.0.0.1')
+        port (int):
+            Optional: Port to listen on (default=8765)
+        secret (str):
+            Secret configured for the webhooks in Nexus.  Requests without a
+            valid signature are rejected, the engine does not start without it
+        path (str):
+            Optional: URL path the webhooks are posted to (default='/nexus3')
+        max_body (int):
+            Optional: Largest accepted payload in bytes (default=1048576)
+    """
+    if not secret:
+        log.error('Nexus3 webhook engine not started, a secret is required to check webhook signatures')
+        return
+
+    if __opts__.get('__role') == 'master':
+        fire = salt.utils.event.get_master_event(__opts__, __opts__['sock_dir'], listen=False).fire_event
+    else:
+        # Events of a minion engine are sent on to the master so reactors see them
+        def fire(data, tag):
+            __salt__['event.send'](tag, data)
+
+    server = _ThreadingHTTPServer((address, port), _handler(fire, secret, path, max_body))
+    log.info('Nexus3 webhook engine listening on {0}:{1}{2}'.format(address, port, path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+"""
+Execution module for reading the state of Nexus 3
+
+Complements the nexus3 state module, which provisions repositories, blob stores
+and tasks, with functions that report on them afterwards.  Uses the same
+nexus3 configuration block, script upload markers and rate limit as the states.
+
+:depends: requests
+
+:configuration: In order to connect to Nexus 3, certain configuration is required
+    in /etc/salt/minion on the relevant minions otherwise defaults are used. A sample dictionary might look
+    like:
+
+        nexus3:
+          host: '127.0.0.1:8081'
+          user: 'admin'
+          pass: 'admin123'
+
+    The functions that read Nexus take a profile argument to read one of the
+    nodes configured under profiles instead, see the nexus3 state module.
+
+Show blob store fill levels, failed tasks and blocked or offline repositories
+
+.. code-block:: bash
+
+    salt '*' nexus3.health
+
+Write Nexus metrics for the node_exporter textfile collector
+
+.. code-block:: bash
+
+    salt '*' nexus3.prometheus_textfile /var/lib/node_exporter/textfile_collector/nexus3.prom
+
+Report request counts, status mix and latency per repository from request.log
+
+.. code-block:: bash
+
+    salt '*' nexus3.request_log_report /data/nexus/log
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import time
+
+import salt.exceptions
+
+try:
+    import requests
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = 'nexus3'
+
+_HEALTH_SCRIPT = """
+import groovy.json.JsonOutput
+import org.sonatype.nexus.repository.httpclient.HttpClientFacet
+import org.sonatype.nexus.scheduling.TaskScheduler
+
+blobStores = [:]
+blobStore.blobStoreManager.browse().each { store ->
+    config = store.blobStoreConfiguration
+    metrics = store.metrics
+    quota = config.attributes.get('blobStoreQuotaConfig')
+    blobStores[config.name] = [
+            type: config.type,
+            total_size: metrics.totalSize,
+            available_space: metrics.availableSpace,
+            blob_count: metrics.blobCount,
+            unlimited: metrics.isUnlimited(),
+            quota_type: quota == null ? null : quota.get('quotaType'),
+            quota_limit_bytes: quota == null ? null : quota.get('quotaLimitBytes')
+    ]
+}
+
+tasks = [:]
+container.lookup(TaskScheduler.class.getName()).listsTasks().each { taskInfo ->
+    lastRun = taskInfo.lastRunState
+    tasks[taskInfo.name] = [
+            type_id: taskInfo.typeId,
+            state: taskInfo.currentState.state.toString(),
+            last_run_started: lastRun?.runStarted?.time,
+            last_run_result: lastRun?.endState?.toString()
+    ]
+}
+
+repositories = [:]
+repository.repositoryManager.browse().each { existingRepository ->
+    remoteStatus = null
+    if (existingRepository.type.value == 'proxy') {
+        remoteStatus = existingRepository.optionalFacet(HttpClientFacet).orElse(null)?.status?.type?.toString()
+    }
+    repositories[existingRepository.name] = [
+            recipe_name: existingRepository.configuration.recipeName,
+            online: existingRepository.configuration.online,
+            remote_status: remoteStatus
+    ]
+}
+
+return JsonOutput.toJson([blob_stores: blobStores, tasks: tasks, repositories: repositories])
+"""
+
+_REPOSITORY_STATS_SCRIPT = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import org.sonatype.nexus.repository.storage.Query
+import org.sonatype.nexus.repository.storage.StorageFacet
+
+parsed_args = new JsonSlurper().parseText(args)
+
+// Assets created up to now are counted, the next run continues from here
+now = System.currentTimeMillis()
+
+stats = [:]
+parsed_args.repositories.each { name, since ->
+    existingRepository = repository.repositoryManager.get(name)
+    if (existingRepository == null || existingRepository.type.value == 'group') {
+        return
+    }
+
+    tx = existingRepository.facet(StorageFacet).txSupplier().get()
+    try {
+        tx.begin()
+        newAssets = Query.builder().where('blob_created <= ').param(new Date(now))
+        if (since != null) {
+            newAssets = newAssets.and('blob_created > ').param(new Date(since))
+        }
+        assetCount = 0L
+        assetBytes = 0L
+        tx.findAssets(newAssets.build(), [existingRepository]).each { asset ->
+            assetCount++
+            assetBytes += asset.size() ?: 0L
+        }
+        stats[name] = [
+                assets: tx.countAssets(Query.builder().where('blob_created <= ').param(new Date(now)).build(), [existingRepository]),
+                components: tx.countComponents(Query.builder().build(), [existingRepository]),
+                new_assets: assetCount,
+                new_bytes: assetBytes
+        ]
+    }
+    finally {
+        tx.close()
+    }
+}
+
+return JsonOutput.toJson([now: now, repositories: stats])
+"""
+
+
+# clientHost ident user [date] "request" status bytesIn bytesSent elapsed "userAgent" [thread]
+_REQUEST_LOG_LINE = re.compile(r'^\S+ \S+ \S+ \[[^\]]*\] "(\S+) ([^" ]+)[^"]*" (\d{3}) (\S+) (\S+) (\d+)')
+
+
+class _QuantileSketch:
+    """
+    Approximate quantiles in constant memory.  Values are counted in
+    logarithmic buckets, so a quantile is within relative_accuracy of the
+    real value no matter how many values were added
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+        self.max = 0
+
+    def add(self, value):
+        bucket = int(math.ceil(math.log(max(value, 1)) / self.log_gamma))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, quantile):
+        if not self.count:
+            return None
+        # Nearest rank, the smallest value with at least quantile of the values at or below it
+        rank = max(int(math.ceil(quantile * self.count)), 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # Middle of the bucket, which keeps the relative error symmetric
+                return min(2 * self.gamma ** bucket / (self.gamma + 1), self.max)
+        return self.max
+
+
+def __virtual__():
+    if not HAS_REQUESTS:
+        return False, 'The nexus3 execution module requires the requests library'
+    return __virtualname__
+
+
+def _session(profile=None):
+    """
+    Returns a requests session for the configured Nexus 3 host, or the host
+    of a connection profile.  Sessions are kept in __context__ so repeated
+    calls, i.e. from a beacon, reuse the same connection
+    """
+    try:
+        connection_info = __utils__['nexus3.connection_info'](__salt__['config.option']('nexus3'), profile)
+    except ValueError as err:
+        raise salt.exceptions.CommandExecutionError(str(err))
+    sessions = __context__.setdefault('nexus3.sessions', {})
+    session = sessions.get(profile)
+    if session is None or session.nexus3_host != connection_info['host']:
+        session = requests.Session()
+        session.auth = (connection_info['user'], connection_info['pass'])
+        session.nexus3_host = connection_info['host']
+        sessions[profile] = session
+    return session
+
+
+def _upload_script(session, script_name, script_data, marker):
+    """
+    Uploads a script unless the marker shows it was already uploaded
+    """
+    with __utils__['nexus3.file_lock']('{0}.lock'.format(marker)):
+        if os.path.exists(marker):
+            return True
+
+        url = '{0}/service/rest/v1/script'.format(session.nexus3_host)
+        headers = {'Content-Type': 'application/json'}
+        payload = json.dumps({'name': script_name, 'content': script_data, 'type': 'groovy'})
+        req = session.put('{0}/{1}'.format(url, script_name), headers=headers, data=payload)
+        if req.status_code == 404:
+            req = session.post(url, headers=headers, data=payload)
+        if req.status_code not in (200, 204):
+            log.error('Failed uploading script: {0} Reason: {1}'.format(script_name, req.status_code))
+            return False
+
+        open(marker, 'w').close()
+    return True
+
+
+def _run_script(script_name, script_data, script_args=None, profile=None):
+    """
+    Runs a script that returns a JSON document and returns the decoded document.
+    The script is uploaded first if needed.  Returns None on failure
+    """
+    session = _session(profile)
+    host = session.nexus3_host
+    # The name carries a hash of the content, the same naming as the nexus3 states use
+    script_name = '{0}-{1}'.format(script_name, hashlib.sha256(script_data.encode('utf-8')).hexdigest()[:8])
+    script_hash = hashlib.sha256('\n'.join([host, script_name, script_data]).encode('utf-8')).hexdigest()
+    marker = __utils__['nexus3.lock_path'](__opts__, 'scripts', script_hash)
+    run_url = '{0}/service/rest/v1/script/{1}/run'.format(host, script_name)
+
+    with __utils__['nexus3.throttle'](__opts__, host, __salt__['config.option']('nexus3') or {}):
+        # Retried once when the script was removed from Nexus after it was uploaded
+        for attempt in range(2):
+            try:
+                if not _upload_script(session, script_name, script_data, marker):
+                    return None
+                req = session.post(run_url, headers={'Content-Type': 'text/plain'},
+                                   data=json.dumps(script_args or {}))
+            except requests.exceptions.RequestException as err:
+                log.error('Failed running script: {0} Reason: {1}'.format(script_name, err))
+                return None
+
+            if req.status_code == 404:
+                try:
+                    os.remove(marker)
+                except OSError:
+                    pass
+                continue
+            if req.status_code not in (200, 204):
+                log.error('Failed running script: {0} Reason: {1} {2}'.format(script_name, req.status_code, req.content))
+                return None
+
+            try:
+                return json.loads(req.json()['result'])
+            except (KeyError, TypeError, ValueError):
+                log.error('Script: "{0}" returned invalid JSON: {1}'.format(script_name, req.content))
+                return None
+
+    return None
+
+
+def _used_percent(metrics):
+    """
+    Returns how full a blob store is in percent, measured against its
+    quota if it has one or the free space of the file system otherwise.
+    Returns None if that can't be determined
+    """
+    if metrics['quota_limit_bytes'] and metrics['quota_type'] == 'spaceUsedQuota':
+        return 100.0 * metrics['total_size'] / metrics['quota_limit_bytes']
+    if metrics['unlimited']:
+        return None
+    capacity = metrics['total_size'] + metrics['available_space']
+    return 100.0 * metrics['total_size'] / capacity if capacity else None
+
+
+def health(profile=None):
+    """
+    Read blob store fill levels, the last run of every task and the status
+    of every repository in a single script run
+
+    Args:
+        profile (str):
+            Optional: Connection profile of the Nexus node to read (default=None)
+
+    Returns:
+        dict: blob_stores with size, free space and used_percent, tasks with their
+              last run result and repositories with online and remote_status,
+              which is AUTO_BLOCKED_UNAVAILABLE for auto-blocked proxies.
+              None if Nexus could not be read
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' nexus3.health
+        salt '*' nexus3.health profile=eu
+    """
+    results = _run_script('get_health', _HEALTH_SCRIPT, profile=profile)
+    if results is None:
+        return None
+
+    for metrics in results['blob_stores'].values():
+        metrics['used_percent'] = _used_percent(metrics)
+
+    return results
+
+
+def _write_atomic(path, content):
+    """
+    Writes a file through a temporary file in the same directory,
+    so readers never see a partially written file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix='.{0}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(handle, 'w') as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _repository_stats(repositories, stats_ttl, full_refresh, profile=None):
+    """
+    Returns asset, component and size statistics per repository.  Statistics
+    are kept in the minion cachedir and refreshed after stats_ttl seconds by
+    adding only the assets created since the last refresh.  A repository is
+    counted again from scratch when its asset count shows deletions or after
+    full_refresh seconds
+    """
+    cache_path = __utils__['nexus3.lock_path'](__opts__, 'repository_stats',
+                                              '{0}.json'.format(__utils__['nexus3.host_id'](_session(profile).nexus3_host)))
+    try:
+        with open(cache_path) as cache_file:
+            cached = json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        cached = {}
+
+    now = time.time()
+    stats = dict((name, cached[name]) for name in repositories if name in cached)
+    stale = dict((name, stats[name]) for name in stats if now - stats[name]['refreshed'] >= stats_ttl)
+    for name in repositories:
+        if name not in stats:
+            stale[name] = None
+
+    # Repositories that need a full count are read in a second pass
+    for full_count in (False, True):
+        if full_count:
+            since = dict((name, None) for name in stale)
+        else:
+            since = dict((name, None if entry is None or now - entry['counted'] >= full_refresh else entry['since'])
+                         for name, entry in stale.items())
+        if not since:
+            break
+
+        results = _run_script('get_repository_stats', _REPOSITORY_STATS_SCRIPT, {'repositories': since}, profile)
+        if results is None:
+            break
+
+        recount = {}
+        for name, result in results['repositories'].items():
+            entry = stale[name]
+            if since[name] is None:
+                stats[name] = {'assets': result['assets'],
+                               'components': result['components'],
+                               'bytes': result['new_bytes'],
+                               'since': results['now'],
+                               'refreshed': now,
+                               'counted': now}
+            elif result['assets'] == entry['assets'] + result['new_assets']:
+                stats[name] = dict(entry, assets=result['assets'], components=result['components'],
+                                   bytes=entry['bytes'] + result['new_bytes'],
+                                   since=results['now'], refreshed=now)
+            else:
+                recount[name] = entry
+        stale = recount
+
+    _write_atomic(cache_path, json.dumps(stats))
+    return stats
+
+
+def _prometheus_label(value):
+    """
+    Escapes a Prometheus label value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _prometheus_metrics(metrics, name, help_text, metric_type, samples):
+    """
+    Appends a metric with its HELP and TYPE lines.  samples is a list
+    of (labels dict, value) tuples, samples without a value are left out
+    """
+    samples = [(labels, value) for labels, value in samples if value is not None]
+    if not samples:
+        return
+    metrics.append('# HELP {0} {1}'.format(name, help_text))
+    metrics.append('# TYPE {0} {1}'.format(name, metric_type))
+    for labels, value in samples:
+        label_text = ','.join('{0}="{1}"'.format(key, _prometheus_label(labels[key])) for key in sorted(labels))
+        metrics.append('{0}{1} {2}'.format(name, '{{{0}}}'.format(label_text) if label_text else '', float(value)))
+
+
+def prometheus_textfile(path='/var/lib/node_exporter/textfile_collector/nexus3.prom',
+                        stats_ttl=3600,
+                        full_refresh=86400,
+                        profile=None):
+    """
+    Write Nexus metrics in the Prometheus text format for the textfile
+    collector of node_exporter.  The file is replaced atomically.
+
+    Exports the availability of Nexus, the request, response and cache
+    metrics Nexus publishes on its metrics endpoint, blob store sizes,
+    task results and asset counts and sizes per repository.
+
+    Args:
+        path (str):
+            Optional: File to write (default=/var/lib/node_exporter/textfile_collector/nexus3.prom)
+        stats_ttl (int):
+            Optional: Seconds per repository statistics are reused before they are
+            updated with the assets created since (default=3600)
+        full_refresh (int):
+            Optional: Seconds after which per repository statistics are counted
+            again from scratch (default=86400)
+        profile (str):
+            Optional: Connection profile of the Nexus node to read (default=None)
+    Returns:
+        dict: path of the file and the number of samples written
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' nexus3.prometheus_textfile
+        salt '*' nexus3.prometheus_textfile /srv/metrics/nexus3.prom stats_ttl=600
+        salt '*' nexus3.prometheus_textfile /srv/metrics/nexus3-eu.prom profile=eu
+    """
+    session = _session(profile)
+    host = session.nexus3_host
+    metrics = []
+    started = time.time()
+
+    def get(endpoint):
+        try:
+            with __utils__['nexus3.throttle'](__opts__, host, __salt__['config.option']('nexus3') or {}):
+                return session.get('{0}{1}'.format(host, endpoint), timeout=30)
+        except requests.exceptions.RequestException as err:
+            log.error('Failed reading {0} Reason: {1}'.format(endpoint, err))
+            return None
+
+    status = get('/service/rest/v1/status')
+    writable = get('/service/rest/v1/status/writable')
+    _prometheus_metrics(metrics, 'nexus_up', 'Nexus is available', 'gauge',
+                        [({}, status is not None and status.status_code == 200)])
+    _prometheus_metrics(metrics, 'nexus_writable', 'Nexus accepts writes', 'gauge',
+                        [({}, writable is not None and writable.status_code == 200)])
+
+    # Dropwizard metrics of Nexus, i.e. the jetty request timer and response meters
+    data = get('/service/metrics/data')
+    if data is not None and data.status_code == 200:
+        data = data.json()
+        _prometheus_metrics(metrics, 'nexus_gauge', 'Nexus gauge metrics', 'gauge',
+                            [({'name': name}, gauge.get('value')) for name, gauge in sorted(data.get('gauges', {}).items())
+                             if isinstance(gauge.get('value'), (int, float)) and not isinstance(gauge.get('value'), bool)])
+        _prometheus_metrics(metrics, 'nexus_counter', 'Nexus counter metrics', 'gauge',
+                            [({'name': name}, counter['count']) for name, counter in sorted(data.get('counters', {}).items())])
+        _prometheus_metrics(metrics, 'nexus_meter_total', 'Nexus meter metrics', 'counter',
+                            [({'name': name}, meter['count']) for name, meter in sorted(data.get('meters', {}).items())])
+        timers = sorted(data.get('timers', {}).items())
+        _prometheus_metrics(metrics, 'nexus_timer_total', 'Nexus timer metrics', 'counter',
+                            [({'name': name}, timer['count']) for name, timer in timers])
+        _prometheus_metrics(metrics, 'nexus_timer_seconds', 'Nexus timer quantiles in seconds', 'gauge',
+                            [({'name': name, 'quantile': quantile}, timer.get(key))
+                             for name, timer in timers
+                             for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99'))])
+
+    health_info = health(profile)
+    if health_info is not None:
+        blob_stores = sorted(health_info['blob_stores'].items())
+        _prometheus_metrics(metrics, 'nexus_blobstore_size_bytes', 'Size of the blob store', 'gauge',
+                            [({'blob_store': name}, info['total_size']) for name, info in blob_stores])
+        _prometheus_metrics(metrics, 'nexus_blobstore_available_bytes', 'Space available to the blob store', 'gauge',
+                            [({'blob_store': name}, None if info['unlimited'] else info['available_space'])
+                             for name, info in blob_stores])
+        _prometheus_metrics(metrics, 'nexus_blobstore_blobs', 'Blobs in the blob store', 'gauge',
+                            [({'blob_store': name}, info['blob_count']) for name, info in blob_stores])
+        _prometheus_metrics(metrics, 'nexus_blobstore_used_ratio', 'Fill level of the blob store', 'gauge',
+                            [({'blob_store': name}, None if info['used_percent'] is None else info['used_percent'] / 100)
+                             for name, info in blob_stores])
+
+        tasks = sorted(health_info['tasks'].items())
+        _prometheus_metrics(metrics, 'nexus_task_last_run_success', 'Last run of the task succeeded', 'gauge',
+                            [({'task': name, 'type_id': info['type_id']}, info['last_run_result'] == 'OK')
+                             for name, info in tasks if info['last_run_result'] is not None])
+        _prometheus_metrics(metrics, 'nexus_task_last_run_timestamp_seconds', 'Start of the last run of the task', 'gauge',
+                            [({'task': name, 'type_id': info['type_id']}, info['last_run_started'] / 1000.0)
+                             for name, info in tasks if info['last_run_started'] is not None])
+
+        repositories = sorted(health_info['repositories'].items())
+        _prometheus_metrics(metrics, 'nexus_repository_online', 'Repository is online', 'gauge',
+                            [({'repository': name, 'recipe': info['recipe_name']}, info['online'])
+                             for name, info in repositories])
+        _prometheus_metrics(metrics, 'nexus_repository_remote_available', 'Remote of the proxy repository is available',
+                            'gauge', [({'repository': name, 'status': info['remote_status']},
+                                       info['remote_status'] in ('READY', 'AVAILABLE'))
+                                      for name, info in repositories if info['remote_status'] is not None])
+
+        stats = sorted(_repository_stats([name for name, info in repositories
+                                          if not info['recipe_name'].endswith('-group')],
+                                         stats_ttl, full_refresh, profile).items())
+        _prometheus_metrics(metrics, 'nexus_repository_assets', 'Assets in the repository', 'gauge',
+                            [({'repository': name}, info['assets']) for name, info in stats])
+        _prometheus_metrics(metrics, 'nexus_repository_components', 'Components in the repository', 'gauge',
+                            [({'repository': name}, info['components']) for name, info in stats])
+        _prometheus_metrics(metrics, 'nexus_repository_size_bytes', 'Size of the assets in the repository', 'gauge',
+                            [({'repository': name}, info['bytes']) for name, info in stats])
+
+    _prometheus_metrics(metrics, 'nexus_exporter_duration_seconds', 'Time spent collecting the metrics', 'gauge',
+                        [({}, time.time() - started)])
+
+    _write_atomic(path, '\n'.join(metrics) + '\n')
+    return {'path': path,
+            'samples': len([line for line in metrics if not line.startswith('#')])}
+
+
+def _request_log_files(log_dir, state):
+    """
+    Returns (path, offset) of the request log files to read, oldest first.
+    Rotated files that were already read are left out.  Rotated files are
+    named by date, so after any number of rotations the oldest unread file
+    newer than the files read before holds the rest of the request.log read
+    last time and is read from the offset reached, the newer ones from the start
+    """
+    current = os.path.join(log_dir, 'request.log')
+    read = set(state.get('rotated', []))
+    rotated = sorted(path for path in glob.glob(os.path.join(log_dir, 'request-*.log*'))
+                     if os.path.basename(path) not in read)
+    newest_read = max(read) if read else ''
+
+    files = []
+    current_stat = os.stat(current) if os.path.exists(current) else None
+    rotated_away = state.get('inode') is not None and (
+        current_stat is None or current_stat.st_ino != state['inode'] or current_stat.st_size < state['offset'])
+    resumed = False
+    for path in rotated:
+        offset = 0
+        if rotated_away and not resumed and os.path.basename(path) > newest_read:
+            offset = state['offset']
+            resumed = True
+        files.append((path, offset))
+    if current_stat is not None:
+        files.append((current, 0 if rotated_away or state.get('inode') is None else state['offset']))
+    return files
+
+
+def _read_lines(path, offset):
+    """
+    Yields the complete lines of a plain or gzipped file from an offset in
+    the uncompressed content, and the offset after each line
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as log_file:
+        if path.endswith('.gz'):
+            # gzip files can't seek, the content before the offset is skipped in chunks
+            remaining = offset
+            while remaining > 0:
+                chunk = log_file.read(min(remaining, 1048576))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+        else:
+            log_file.seek(offset)
+        for line in log_file:
+            if not line.endswith(b'\n'):
+                # A line still being written is read next time
+                return
+            offset += len(line)
+            yield line, offset
+
+
+def request_log_report(log_dir='/data/nexus/log',
+                       resume=True,
+                       repositories=None,
+                       percentiles=(50, 90, 99)):
+    """
+    Report requests, bytes, status mix and latency per repository from the
+    Nexus request.log, including rotated and gzipped request-<date>.log.gz
+    files.  The log is parsed as a stream and latency percentiles come from
+    approximate quantile sketches (within 1%), so memory use stays constant
+    however large the logs are.
+
+    With resume, the position reached is stored in the minion cachedir and
+    the next call only reports the requests logged since, i.e. when run
+    hourly from the scheduler every report covers the last hour.
+
+    Args:
+        log_dir (str):
+            Optional: Log directory of Nexus (default=/data/nexus/log)
+        resume (bool):
+            Optional: Continue from the position reached by the last call (default=True)
+        repositories (list):
+            Optional: Only report these repositories (default=all)
+        percentiles (list):
+            Optional: Latency percentiles to report (default=[50, 90, 99])
+    Returns:
+        dict: requests, bytes_sent, bytes_received, status (requests per status
+              class), success_rate (share of requests answered with 2xx or 304) and
+              latency_ms percentiles per repository, plus the lines read and
+              the lines that could not be parsed
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' nexus3.request_log_report
+        salt '*' nexus3.request_log_report /data/nexus/log resume=False repositories='[maven-public]'
+    """
+    state_path = __utils__['nexus3.lock_path'](__opts__, 'request_log',
+                                              '{0}.json'.format(__utils__['nexus3.host_id'](os.path.abspath(log_dir))))
+    state = {}
+    if resume:
+        try:
+            with open(state_path) as state_file:
+                state = json.load(state_file)
+        except (IOError, OSError, ValueError):
+            state = {}
+
+    stats = {}
+    lines = 0
+    unparsed = 0
+    files = _request_log_files(log_dir, state)
+    current = os.path.join(log_dir, 'request.log')
+    offset = 0
+    for path, start in files:
+        offset = start
+        for line, offset in _read_lines(path, start):
+            lines += 1
+            match = _REQUEST_LOG_LINE.match(line.decode('utf-8', 'replace'))
+            if match is None:
+                unparsed += 1
+                continue
+
+            method, url, status, bytes_received, bytes_sent, elapsed = match.groups()
+            parts = url.split('/', 3)
+            if len(parts) < 3 or parts[1] != 'repository' or not parts[2]:
+                continue
+            repository = parts[2]
+            if repositories is not None and repository not in repositories:
+                continue
+
+            entry = stats.get(repository)
+            if entry is None:
+                entry = stats[repository] = {'requests': 0,
+                                             'bytes_sent': 0,
+                                             'bytes_received': 0,
+                                             'status': {},
+                                             'successes': 0,
+                                             'latency': _QuantileSketch()}
+            entry['requests'] += 1
+            entry['bytes_sent'] += int(bytes_sent) if bytes_sent.isdigit() else 0
+            entry['bytes_received'] += int(bytes_received) if bytes_received.isdigit() else 0
+            status_class = '{0}xx'.format(status[0])
+            entry['status'][status_class] = entry['status'].get(status_class, 0) + 1
+            if status[0] == '2' or status == '304':
+                entry['successes'] += 1
+            entry['latency'].add(int(elapsed))
+
+    if resume:
+        rotated = set(state.get('rotated', []))
+        rotated.update(os.path.basename(path) for path, start in files if path != current)
+        # Rotated files Nexus deleted since are forgotten, so the state stays small
+        rotated = set(file_name for file_name in rotated if os.path.exists(os.path.join(log_dir, file_name)))
+        new_state = {'rotated': sorted(rotated), 'inode': None, 'offset': 0}
+        if files and files[-1][0] == current:
+            new_state.update(inode=os.stat(current).st_ino, offset=offset)
+        _write_atomic(state_path, json.dumps(new_state))
+
+    report = {}
+    for repository, entry in sorted(stats.items()):
+        latency = entry.pop('latency')
+        successes = entry.pop('successes')
+        entry['success_rate'] = round(float(successes) / entry['requests'], 4)
+        entry['latency_ms'] = dict(('p{0}'.format(percentile), round(latency.quantile(percentile / 100.0), 1))
+                                   for percentile in percentiles)
+        entry['latency_ms']['max'] = latency.max
+        report[repository] = entry
+
+    return {'lines': lines,
+            'unparsed': unparsed,
+            'repositories': report}
@@ -18,6 +18,58 @@ module itself.
           user: 'admin'
           pass: 'admin123'
 
+    Setting state_cache to True keeps the arguments last applied to each
+    repository, blob store, role, user, task, cleanup policy and the global
+    settings in the minion cache.  Those states are skipped while neither
+    their arguments nor the server side configuration changed since the
+    last successful run:
+
+        nexus3:
+          host: '127.0.0.1:8081'
+          state_cache: True
+
+    Scripts are uploaded once per script content, under a name ending in a
+    hash of the content, and only run afterwards,
+    also when states run with parallel: True.  max_concurrency (default=4)
+    limits how many scripts run against a Nexus host at the same time across
+    all parallel states on the minion, 0 removes the limit.  rate_limit
+    caps the script runs per second with a token bucket of rate_burst tokens
+    (default=rate_limit) shared by all nexus3 states and execution modules
+    on the minion, by default there is no rate limit:
+
+        nexus3:
+          host: '127.0.0.1:8081'
+          max_concurrency: 8
+          rate_limit: 5
+          rate_burst: 10
+
+    Additional Nexus nodes can be configured as named profiles.  Values missing
+    from a profile fall back to the top level settings:
+
+        nexus3:
+          user: 'admin'
+          pass: 'admin123'
+          profiles:
+            eu:
+              host: 'https://nexus-eu.example.com'
+            us:
+              host: 'https://nexus-us.example.com'
+            staging:
+              host: 'https://nexus-staging.example.com'
+              pass: 'staging123'
+
+    Every state except backup accepts a profiles argument with a list of
+    profile names.  The state is applied to all of them concurrently and the
+    changes and comments are reported per profile:
+
+        maven-releases:
+          nexus3.repo_hosted:
+            - repo_type: maven
+            - profiles:
+              - eu
+              - us
+              - staging
+
 Enable or disable anonymous access to Nexus
 
 .. code-block:: yaml
@@ -26,6 +78,14 @@ Enable or disable anonymous access to Nexus
       nexus3.allow_anonymous_access:
         - option: False
 
+Backup the database and blob stores to /backup/nexus
+
+.. code-block:: yaml
+
+    /backup/nexus:
+      nexus3.backup:
+        - data_dir: /data/nexus
+
 Set base url for Nexus
 
 .. code-block:: yaml
@@ -51,6 +111,73 @@ Create blobstore
         - s3_access_key_id: access-key
         - s3_secret_access_key: secret-access-key
 
+    # soft quota of 500GB used space
+    docker-1:
+      nexus3.blobstore:
+        - path: /mnt/disk1/blobs/docker-1
+        - quota_type: used
+        - quota_limit: 512000
+
+Create blobstore group striped across two disks
+
+.. code-block:: yaml
+
+    docker:
+      nexus3.blobstore_group:
+        - fill_policy: round_robin
+        - members:
+          - docker-1: /mnt/disk1/blobs/docker-1
+          - docker-2: /mnt/disk2/blobs/docker-2
+
+Disable background capabilities on an air-gapped node
+
+.. code-block:: yaml
+
+    OutreachManagementCapability:
+      nexus3.capability:
+        - enabled: False
+
+    background-capabilities:
+      nexus3.capabilities:
+        - capabilities:
+          - type_id: analytics-configuration
+            enabled: False
+          - type_id: healthcheck
+            enabled: False
+
+Create content selectors
+
+.. code-block:: yaml
+
+    team-selectors:
+      nexus3.content_selectors:
+        - selectors:
+            team-a-maven:
+              description: 'Team A maven artifacts'
+              search_expression: 'format == "maven2" and path =^ "/com/example/team-a/"'
+
+Delete a repository and a blobstore
+
+.. code-block:: yaml
+
+    old-maven-proxy:
+      nexus3.repo_absent
+
+    old-maven:
+      nexus3.blobstore_absent:
+        - require:
+          - nexus3: old-maven-proxy
+
+Delete all repositories and blobstores that are not in pillar
+(run with test=True first for a report)
+
+.. code-block:: yaml
+
+    prune_unmanaged:
+      nexus3.prune_unmanaged:
+        - repositories: {{ (nexus['repos'].get('proxy', {}).keys() | list) + (nexus['repos'].get('hosted', {}).keys() | list) }}
+        - blob_stores: {{ salt['pillar.get']('nexus:blob_stores', {}).keys() | list }}
+
 Enable Docker Bearer Token Realm
 
 .. code-block:: yaml
@@ -60,6 +187,77 @@ Enable Docker Bearer Token Realm
         - name: DockerToken
         - status: True
 
+Use a corporate proxy except for upstreams on the local network
+
+.. code-block:: yaml
+
+    corporate_proxy:
+      nexus3.http_proxy:
+        - http_proxy_host: proxy.example.com
+        - http_proxy_port: 3128
+        - https_proxy_host: proxy.example.com
+        - https_proxy_port: 3128
+        - non_proxy_hosts:
+          - '*.lan.example.com'
+          - 10.0.0.0/8
+
+Configure LDAP servers, closest one first
+
+.. code-block:: yaml
+
+    ldap-local:
+      nexus3.ldap:
+        - hostname: ldap1.dc1.example.com
+        - search_base: dc=example,dc=com
+        - user_base_dn: ou=people
+        - connection_timeout: 5
+        - connection_retry_delay: 60
+        - order: 0
+
+Configure the node from one minion at a time and skip the run
+when the same pillar data was already applied by another minion
+
+.. code-block:: yaml
+
+    nexus-config:
+      nexus3.lease:
+        - version: {{ salt['pillar.get']('nexus') | json | md5 }}
+        - order: 1
+
+    nexus-config-done:
+      nexus3.lease_release:
+        - name: nexus-config
+        - version: {{ salt['pillar.get']('nexus') | json | md5 }}
+        - order: last
+
+Create privileges
+
+.. code-block:: yaml
+
+    team-privileges:
+      nexus3.privileges:
+        - privileges:
+          - name: team-a-maven-read
+            description: 'Read team-a maven repos'
+            type: repository-view
+            format: maven2
+            repository: team-a-maven
+            actions:
+              - browse
+              - read
+
+Set the realm order, local accounts first
+
+.. code-block:: yaml
+
+    realm_chain:
+      nexus3.realm_order:
+        - realms:
+          - NexusAuthenticatingRealm
+          - NexusAuthorizingRealm
+          - DockerToken
+          - LdapRealm
+
 Create repo hosted for maven
 
 .. code-block:: yaml
@@ -71,6 +269,23 @@ Create repo hosted for maven
         - maven_layout_policy: strict
         - strict_content_validation: True
 
+Remove snapshots not downloaded in 30 days from a maven repo
+
+.. code-block:: yaml
+
+    maven-snapshots-30d:
+      nexus3.cleanup_policy:
+        - format: maven
+        - last_downloaded: 30
+        - prerelease: True
+
+    maven-snapshots:
+      nexus3.repo_hosted:
+        - repo_type: maven
+        - maven_version_policy: snapshot
+        - cleanup_policies:
+          - maven-snapshots-30d
+
 Create repo group for maven
 
 .. code-block:: yaml
@@ -93,6 +308,16 @@ Note: the blob_store in this example needs to be created first
         - blob_store: yum
         - strict_content_validation: True
 
+Create repo hosted for docker on the blob store with the most free space
+
+.. code-block:: yaml
+    docker-hosted:
+      nexus3.repo_hosted:
+        - repo_type: docker
+        - blob_store:
+          - docker-1
+          - docker-2
+
 Create role
 
 .. code-block:: yaml
@@ -105,6 +330,14 @@ Create role
         - roles:
           - repo-user
 
+Create roles in bulk from pillar
+
+.. code-block:: yaml
+
+    nexus-roles:
+      nexus3.roles:
+        - roles: {{ salt['pillar.get']('nexus:roles') }}
+
 Create task for database backup
 Note: The key/values under task_properties is indented 4 spaces instead
 of two.  This is how salt creates a dictionary from the yaml
@@ -118,6 +351,37 @@ of two.  This is how salt creates a dictionary from the yaml
             location:'/nexus-data/backup'
         - task_cron: '0 0 21 * * ?'
 
+Backup the database and compact a blob store before continuing
+
+.. code-block:: yaml
+
+    database-backup:
+      nexus3.task_run:
+        - timeout: 7200
+
+    compact-docker:
+      nexus3.task_run:
+        - require:
+          - nexus3: database-backup
+
+Spread maintenance tasks across a window from 21:00 to 05:00
+
+.. code-block:: yaml
+
+    nightly_maintenance:
+      nexus3.task_schedule:
+        - window_start: '21:00'
+        - window_end: '05:00'
+        - tasks:
+            database-backup:
+              task_type_id: 'db.backup'
+              task_properties:
+                location: '/nexus-data/backup'
+            compact-docker:
+              task_type_id: 'blobstore.compact'
+              task_properties:
+                blobstoreName: 'docker'
+
 Create user
 Note: role(s) must exist first
 
@@ -132,18 +396,68 @@ Note: role(s) must exist first
         - roles:
           - repo-user
 
+Create users in bulk from pillar and a CSV file and delete unmanaged users
+
+.. code-block:: yaml
+
+    engineering:
+      nexus3.users:
+        - users: {{ salt['pillar.get']('nexus:users') }}
+        - source: /srv/nexus/engineering-users.csv
+        - prune: True
+
+Send repository and audit events to the nexus3_webhook engine on the salt master.
+The engine listens on 127.0.0.1 by default, so it has to be configured with an
+address Nexus can reach and the same secret:
+
+.. code-block:: yaml
+
+    # master config
+    engines:
+      - nexus3_webhook:
+          address: 0.0.0.0
+          port: 8765
+          secret: shared-webhook-secret
+
+.. code-block:: yaml
+
+    salt-master:
+      nexus3.webhook:
+        - url: http://salt.example.com:8765/nexus3
+        - secret: shared-webhook-secret
+
 """
 # from __future__ import absolute_import, print_function, unicode_literals
 
+import concurrent.futures
+import contextvars
+import csv
+import functools
+import gzip
+import hashlib
+import inspect
 import json
 import logging
+import os
+import re
+import threading
+import time
 
 import requests
+import salt.cache
+import salt.exceptions
 
 import nexus_groovy
 
 log = logging.getLogger(__name__)
 
+# Name of the connection profile a state is running against in the current thread
+_active_profile = threading.local()
+
+# States that are never skipped because of a lease, either managing the lease
+# itself or operational states that run tasks instead of applying configuration
+_LEASE_STATES = ('lease', 'lease_release', 'task_run', 'backup')
+
 
 class _ScriptClient:
     """
@@ -157,6 +471,7 @@ class _ScriptClient:
         self.script_name = script_name
         self.script_data = script_data
         self.url = '{0}/service/rest/v1/script'.format(host)
+        self.status_code = None
 
     def delete(self):
         """
@@ -168,7 +483,7 @@ class _ScriptClient:
         if self.get():
             log.debug('Deleting script: {0}'.format(self.script_name).format(self.script_name))
             req = requests.delete(delete_url, auth=(self.username, self.password))
-            if req.status_code == 204 or 200:
+            if req.status_code in (200, 204):
                 resp = req.content
                 return resp
             log.error('Failed deleting script: {0} Reason: {1}'.format(self.script_name, req.status_code))
@@ -185,9 +500,12 @@ class _ScriptClient:
         try:
             log.debug('Checking for script: {0}'.format(self.script_name))
             req = requests.get(get_url, auth=(self.username, self.password))
-            if req.status_code == 204 or 200:
+            if req.status_code == 200:
                 resp = req.content
                 return resp
+            if req.status_code == 404:
+                log.debug('Script does not exist: {0}'.format(self.script_name))
+                return resp
             log.error('Failed checking for script: {0} Reason: {1}'.format(self.script_name, req.status_code))
         except Exception as e:
             log.error('Failed checking for script: {0} Reason: {1}'.format(self.script_name, e))
@@ -203,7 +521,8 @@ class _ScriptClient:
     def run(self, script_args):
         """
         Runs script to Nexus 3 script API
-        Returns false if script does not exist
+        Returns false if script does not exist,
+        status_code is 404 in that case
 
         Results returned as null from the script API
         is actually a positive in this case
@@ -213,13 +532,16 @@ class _ScriptClient:
         payload = json.dumps(script_args)
 
         resp = False
-        if self.get():
-            log.debug('Running script: {0}'.format(self.script_name))
-            req = requests.post(run_url, auth=(self.username, self.password), headers=headers, data=payload)
-            if req.status_code == 204 or 200:
-                resp = req.json()
-                return resp
-            log.error('Failed running script: {0}" Reason: {1} {2}'.format(self.script_name, req.status_code, req.json()))
+        log.debug('Running script: {0}'.format(self.script_name))
+        req = requests.post(run_url, auth=(self.username, self.password), headers=headers, data=payload)
+        self.status_code = req.status_code
+        if req.status_code in (200, 204):
+            resp = req.json()
+            return resp
+        if req.status_code == 404:
+            log.debug('Script does not exist: {0}'.format(self.script_name))
+            return resp
+        log.error('Failed running script: {0}" Reason: {1} {2}'.format(self.script_name, req.status_code, req.content))
 
         return resp
 
@@ -227,7 +549,8 @@ class _ScriptClient:
         """
         Uploads script to Nexus 3 script API
         If a script of the same name already exists,
-        it will be updated/replaced
+        it will be updated/replaced unless the content
+        is already the same
         """
 
         data = {'name': self.script_name,
@@ -238,18 +561,26 @@ class _ScriptClient:
 
         headers = {'Content-Type': 'application/json'}
         resp = False
-        if self.get():
+        existing = self.get()
+        if existing:
+            try:
+                if json.loads(existing).get('content') == self.script_data:
+                    log.debug('Script is up to date: {0}'.format(self.script_name))
+                    resp = True
+                    return resp
+            except ValueError:
+                pass
             log.debug('Updating script: {0}'.format(self.script_name))
             upload_url = '{0}/{1}'.format(self.url, self.script_name)
             req = requests.put(upload_url, auth=(self.username, self.password), headers=headers, data=payload)
-            if req.status_code == 204 or 200:
+            if req.status_code in (200, 204):
                 resp = True
                 return resp
             log.error('Failed updating script: {0} Reason: {1}'.format(self.script_name, req.status_code))
         else:
             log.debug('Uploading script: {0}'.format(self.script_name))
             req = requests.post(self.url, auth=(self.username, self.password), headers=headers, data=payload)
-            if req.status_code == 204 or 200:
+            if req.status_code in (200, 204):
                 resp = True
                 return resp
             log.error('Failed uploading script "{0}." Reason: {1}'.format(self.script_name, req.status_code))
@@ -260,24 +591,42 @@ class _ScriptClient:
 def _connection_info():
     """
     Returns connection information used for the Nexus3 connection.
+    When a state runs against a named profile, the profile settings
+    are used and missing values fall back to the top level settings.
     """
-    defaults = {'host': 'http://127.0.0.1:8081',
-                'user': 'admin',
-                'pass': 'admin123'}
-
-    # return defaults
-    connection_info = {}
-    _opts = __salt__['config.option']('nexus3')
-    default_addrs_used = []
-    for attr in defaults:
-        if attr not in _opts:
-            default_addrs_used.append(attr)
-            connection_info[attr] = defaults[attr]
-            continue
-        connection_info[attr] = _opts[attr]
-    if default_addrs_used:
-        log.info('Using default value for Nexus3: {0}'.format(default_addrs_used))
-    return connection_info
+    return __utils__['nexus3.connection_info'](__salt__['config.option']('nexus3'),
+                                               getattr(_active_profile, 'name', None))
+
+
+def _versioned_script_name(script_name, script_data):
+    """
+    Returns the script name with a short hash of the script content.  Running a
+    script by this name always runs this content, even when minions with other
+    versions of the module upload their own versions of the script
+    """
+    return '{0}-{1}'.format(script_name, hashlib.sha256(script_data.encode('utf-8')).hexdigest()[:8])
+
+
+def _upload_script(client, force=False):
+    """
+    Uploads a script once per script content.  A marker in the minion
+    cachedir records the upload, so later and parallel states only run the
+    script.  The upload itself happens under a lock keyed by the script hash
+    so parallel states never upload the same script at the same time
+    """
+    script_hash = hashlib.sha256('\n'.join([client.host, client.script_name, client.script_data])
+                                 .encode('utf-8')).hexdigest()
+    marker = __utils__['nexus3.lock_path'](__opts__, 'scripts', script_hash)
+    if os.path.exists(marker) and not force:
+        return True
+
+    with __utils__['nexus3.file_lock']('{0}.lock'.format(marker)):
+        if os.path.exists(marker) and not force:
+            return True
+        if not client.upload():
+            return False
+        open(marker, 'w').close()
+    return True
 
 
 def _script_processor(script_name, script_data, script_args, ret):
@@ -286,13 +635,18 @@ def _script_processor(script_name, script_data, script_args, ret):
     client = _ScriptClient(connection_info['host'],
                            connection_info['user'],
                            connection_info['pass'],
-                           script_name,
+                           _versioned_script_name(script_name, script_data),
                            script_data)
 
-    upload_results = client.upload()
+    with __utils__['nexus3.throttle'](__opts__, connection_info['host'], __salt__['config.option']('nexus3') or {}):
+        upload_results = _upload_script(client)
+        run_results = client.run(script_args) if upload_results else False
+        if upload_results and not run_results and client.status_code == 404:
+            # the script was removed from Nexus after an earlier run uploaded it
+            upload_results = _upload_script(client, force=True)
+            run_results = client.run(script_args) if upload_results else False
 
     if upload_results:
-        run_results = client.run(script_args)
         if run_results:
             ret['changes'] = {'nexus': run_results['result']}
         else:
@@ -305,6 +659,401 @@ def _script_processor(script_name, script_data, script_args, ret):
     return ret
 
 
+def _script_json(script_name, script_data, script_args):
+    """
+    Uploads and runs a script that returns a JSON document
+    and returns the decoded document.  Returns None if the
+    script could not be uploaded or run
+    """
+    ret = {'changes': {}, 'result': True}
+    _script_processor(script_name, script_data, script_args, ret)
+    if not ret['result']:
+        log.error(ret['comment'])
+        return None
+
+    try:
+        return json.loads(ret['changes']['nexus'])
+    except (TypeError, ValueError):
+        log.error('Script: "{0}" returned invalid JSON: {1}'.format(script_name, ret['changes']['nexus']))
+        return None
+
+
+def _chunks(items, chunk_size):
+    """
+    Yields lists of at most chunk_size items from an iterable
+    without reading the whole iterable first
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _blob_store_free_space(metrics):
+    """
+    Returns the number of bytes that can still be written to a blob store
+    before it runs out of disk space or breaches its soft quota
+    """
+    free_space = metrics['available_space']
+    if metrics['quota_type'] == 'spaceUsedQuota':
+        free_space = min(free_space, metrics['quota_limit_bytes'] - metrics['total_size'])
+    elif metrics['quota_type'] == 'spaceRemainingQuota':
+        free_space = free_space - metrics['quota_limit_bytes']
+
+    return free_space
+
+
+def _select_blob_store(repo_name, blob_store):
+    """
+    Returns the blob store a repository should use.
+
+    blob_store may be the name of a single blob store or a list of
+    blob stores (a pool).  When a pool is given the repository keeps the
+    blob store it already uses, otherwise the member with the most free
+    space is picked.  Returns None if the metrics could not be read.
+    """
+    if not isinstance(blob_store, list):
+        return blob_store
+
+    metrics = _script_json('get_blobstore_metrics',
+                           nexus_groovy.get_blobstore_metrics,
+                           {'names': blob_store, 'repository': repo_name})
+    if metrics is None:
+        return None
+
+    if metrics['repository_blob_store']:
+        return metrics['repository_blob_store']
+
+    candidates = [name for name in blob_store if name in metrics['blob_stores']]
+    if not candidates:
+        log.error('None of the blob stores in pool {0} exist'.format(blob_store))
+        return None
+
+    selected = max(candidates, key=lambda name: _blob_store_free_space(metrics['blob_stores'][name]))
+    log.info('Selected blob store "{0}" from pool {1} for repo: {2}'.format(selected, blob_store, repo_name))
+    return selected
+
+
+def _window_minutes(value):
+    """
+    Converts a 'HH:MM' time of day to minutes since midnight
+    """
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _stagger_tasks(durations, volumes, window_length, max_concurrent):
+    """
+    Returns the start offset in minutes from the beginning of the
+    maintenance window for each task.
+
+    Longest tasks are placed first at the earliest time where fewer than
+    max_concurrent tasks run and no other task runs on the same volume.
+    Any time left over in the window is spread evenly between the starts.
+    """
+    scheduled = {}
+    for name in sorted(durations, key=lambda task_name: (-durations[task_name], task_name)):
+        start = 0
+        end = durations[name]
+        while True:
+            overlapping = [scheduled[other] for other in scheduled
+                           if scheduled[other][0] < end and start < scheduled[other][1]]
+            same_volume = [other for other in overlapping
+                           if volumes[name] is not None and other[2] == volumes[name]]
+            if len(overlapping) < max_concurrent and not same_volume:
+                break
+            start = min(other[1] for other in overlapping)
+            end = start + durations[name]
+        scheduled[name] = (start, end, volumes[name])
+
+    if not scheduled:
+        return {}
+
+    makespan = max(interval[1] for interval in scheduled.values())
+    if makespan > window_length:
+        log.warning('Scheduled tasks need {0} minutes but the maintenance window is only {1} minutes'.format(
+            makespan, window_length))
+    slack = max(window_length - makespan, 0)
+
+    ordered = sorted(scheduled, key=lambda task_name: (scheduled[task_name][0], task_name))
+    return dict((name, scheduled[name][0] + slack * index // len(ordered))
+                for index, name in enumerate(ordered))
+
+
+def _load_backup_manifest(manifest_path):
+    """
+    Reads the backup manifest written by the previous backup run.
+    The manifest holds one JSON document per line with the relative path,
+    size, mtime and sha256 of each file that was copied
+    """
+    manifest = {}
+    if not os.path.exists(manifest_path):
+        return manifest
+
+    with open(manifest_path) as manifest_file:
+        for line in manifest_file:
+            entry = json.loads(line)
+            manifest[entry['path']] = entry
+
+    return manifest
+
+
+def _write_backup_manifest(manifest_path, manifest):
+    """
+    Writes the backup manifest next to the backup so the next run
+    only copies files that changed
+    """
+    tmp_path = '{0}.tmp'.format(manifest_path)
+    with open(tmp_path, 'w') as manifest_file:
+        for path in sorted(manifest):
+            manifest_file.write(json.dumps(manifest[path]) + '\n')
+    os.rename(tmp_path, manifest_path)
+
+
+def _backup_file(source_path, target_path, compress, chunk_size):
+    """
+    Streams a file to the backup target in chunks, optionally gzip compressed,
+    and returns the sha256 of the source content.  The copy is written to a
+    temporary file first so an interrupted run never leaves a partial file behind
+    """
+    target_dir = os.path.dirname(target_path)
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir)
+
+    checksum = hashlib.sha256()
+    tmp_path = '{0}.tmp'.format(target_path)
+    # The source is opened first, files can disappear while the blob store is compacted
+    with open(source_path, 'rb') as source_file:
+        try:
+            with (gzip.open(tmp_path, 'wb') if compress else open(tmp_path, 'wb')) as target_file:
+                chunk = source_file.read(chunk_size)
+                while chunk:
+                    checksum.update(chunk)
+                    target_file.write(chunk)
+                    chunk = source_file.read(chunk_size)
+            os.rename(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return checksum.hexdigest()
+
+
+def _nexus3_option(key, default=None):
+    """
+    Returns a single option from the nexus3 configuration block
+    """
+    return (__salt__['config.option']('nexus3') or {}).get(key, default)
+
+
+def _state_cache_bank():
+    """
+    Returns the Salt cache bank holding the state cache for the configured Nexus 3 host
+    """
+    return 'nexus3/{0}'.format(__utils__['nexus3.host_id'](_connection_info()['host']))
+
+
+def _server_fingerprints(keys=None):
+    """
+    Returns a dict of configuration fingerprints keyed by resource.  The full
+    set is read once per Salt run and kept in __context__, a list of keys
+    reads only those fingerprints fresh from the server
+    """
+    context_key = 'nexus3.fingerprints.{0}'.format(_connection_info()['host'])
+    if keys is None and context_key in __context__:
+        return __context__[context_key]
+
+    fingerprints = _script_json('get_fingerprints', nexus_groovy.get_fingerprints, {'keys': keys})
+    if keys is None and fingerprints is not None:
+        __context__[context_key] = fingerprints
+    return fingerprints
+
+
+def _scripts_hash():
+    """
+    Returns a hash of every groovy script so upgrading the module invalidates the state cache
+    """
+    if 'nexus3.scripts_hash' not in __context__:
+        scripts = hashlib.sha256()
+        for script_name in sorted(vars(nexus_groovy)):
+            script_data = getattr(nexus_groovy, script_name)
+            if not script_name.startswith('_') and isinstance(script_data, str):
+                scripts.update(script_data.encode('utf-8'))
+        __context__['nexus3.scripts_hash'] = scripts.hexdigest()
+    return __context__['nexus3.scripts_hash']
+
+
+def _cached(resource_key):
+    """
+    Decorator that skips a state when its arguments match the last successful
+    run and the server side fingerprint of the resource has not changed since.
+
+    The last applied arguments and fingerprint are kept per resource in Salt's
+    cache subsystem, so an unchanged resource costs nothing beyond the single
+    fingerprint read shared by every state in the run.  Only active when
+    state_cache is enabled in the nexus3 configuration.
+
+    Args:
+        resource_key (str):
+            Fingerprint key of the resource managed by the state,
+            formatted with the state arguments (i.e. 'repository:{name}')
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _nexus3_option('state_cache', False) or __opts__['test'] or kwargs.get('run_now'):
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = resource_key.format(**bound.arguments)
+            args_hash = hashlib.sha256(json.dumps([func.__name__, _scripts_hash(), bound.arguments],
+                                                  sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+            cache = salt.cache.factory(__opts__)
+            bank = _state_cache_bank()
+            try:
+                last_run = cache.fetch(bank, key) or {}
+            except salt.exceptions.SaltCacheError as err:
+                log.warning('Unable to read Nexus3 state cache: {0}'.format(err))
+                last_run = {}
+
+            fingerprints = _server_fingerprints()
+            if (fingerprints is not None and key in fingerprints and
+                    last_run.get('args') == args_hash and
+                    last_run.get('fingerprint') == fingerprints[key]):
+                return {'name': bound.arguments['name'],
+                        'changes': {},
+                        'result': True,
+                        'comment': '{0} is unchanged since the last run'.format(key)}
+
+            ret = func(*args, **kwargs)
+
+            current = _server_fingerprints([key]) if ret['result'] else None
+            try:
+                if current and key in current:
+                    cache.store(bank, key, {'args': args_hash, 'fingerprint': current[key]})
+                else:
+                    cache.flush(bank, key)
+            except salt.exceptions.SaltCacheError as err:
+                log.warning('Unable to update Nexus3 state cache: {0}'.format(err))
+            return ret
+
+        # Salt reads the state arguments from the signature
+        wrapper.__signature__ = signature
+        return wrapper
+    return decorator
+
+
+def _run_leased(func, arguments):
+    """
+    Runs a configuration state unless a nexus3.lease state of this run found
+    that the configuration version was already applied to the Nexus 3 node,
+    or could not take the lease because another minion still holds it
+    """
+    lease_info = __context__.get('nexus3.lease.{0}'.format(_connection_info()['host']))
+    if func.__name__ in _LEASE_STATES or not lease_info or lease_info['status'] not in ('applied', 'held'):
+        return func(**arguments)
+
+    if lease_info['status'] == 'held':
+        return {'name': arguments['name'],
+                'changes': {},
+                'result': False,
+                'comment': 'Not applied, the lease is held by minion {0}'.format(lease_info['owner'])}
+
+    return {'name': arguments['name'],
+            'changes': {},
+            'result': True,
+            'comment': 'Configuration version {0} is already applied'.format(lease_info['version'])}
+
+
+def _run_with_profile(profile, func, arguments):
+    """
+    Runs a state function against a single connection profile
+    """
+    _active_profile.name = profile
+    try:
+        return _run_leased(func, arguments)
+    except Exception as err:
+        log.exception('Nexus3 state failed for profile {0}'.format(profile))
+        return {'name': arguments.get('name'),
+                'changes': {},
+                'result': False,
+                'comment': 'Failed with error: {0}'.format(err)}
+    finally:
+        _active_profile.name = None
+
+
+def _fan_out(func):
+    """
+    Decorator that adds the profiles argument to a state.  When profiles is
+    set, the state is applied to every named connection profile concurrently
+    and the per profile results are merged into a single return, with the
+    changes and comments keyed by profile.
+
+    Since Salt 3003 the loader dunders (__salt__, __opts__, __context__ and
+    __utils__) are looked up through a contextvar that new threads do not
+    inherit, so every profile runs in its own copy of the calling context.
+    """
+    signature = inspect.signature(func)
+    fan_out_signature = signature.replace(parameters=list(signature.parameters.values()) + [
+        inspect.Parameter('profiles', inspect.Parameter.POSITIONAL_OR_KEYWORD, default=None)])
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        arguments = fan_out_signature.bind(*args, **kwargs).arguments
+        profiles = arguments.pop('profiles', None)
+        if not profiles:
+            return _run_leased(func, arguments)
+        if isinstance(profiles, str):
+            profiles = [profiles]
+
+        configured = (__salt__['config.option']('nexus3') or {}).get('profiles', {})
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(profiles)) as executor:
+            futures = {}
+            for profile in profiles:
+                if profile not in configured:
+                    results[profile] = {'changes': {},
+                                        'result': False,
+                                        'comment': 'Nexus3 profile {0} is not configured'.format(profile)}
+                    continue
+                # A context can only be entered by one thread at a time, copy it per profile
+                futures[profile] = executor.submit(contextvars.copy_context().run,
+                                                   _run_with_profile, profile, func, arguments)
+            for profile, future in futures.items():
+                results[profile] = future.result()
+
+        ret = {'name': arguments['name'],
+               'changes': {},
+               'result': True,
+               'comment': ''}
+        comments = []
+        for profile in profiles:
+            result = results[profile]
+            if result['changes']:
+                ret['changes'][profile] = result['changes']
+            if result['result'] is False:
+                ret['result'] = False
+            elif result['result'] is None and ret['result'] is True:
+                ret['result'] = None
+            comments.append('{0}: {1}'.format(profile, result['comment']))
+        ret['comment'] = '\n'.join(comments)
+        return ret
+
+    # Salt reads the state arguments from the signature
+    wrapper.__signature__ = fan_out_signature
+    return wrapper
+
+
+@_fan_out
+@_cached('anonymous_access')
 def allow_anonymous_access(name,
                            enable=False):
     """
@@ -336,6 +1085,147 @@ def allow_anonymous_access(name,
     return results
 
 
+def backup(name,
+           data_dir,
+           backup_task='database-backup',
+           backup_dir='backup',
+           blob_dir='blobs',
+           compress=True,
+           prune=False,
+           chunk_size=1048576,
+           timeout=7200):
+    """
+    Run the Nexus database backup task, wait for it to finish and copy the
+    database export and blob stores to a backup target.
+
+    The copy is incremental.  A manifest of every copied file is kept in the
+    target and only files whose size or modification time changed since the
+    last run are copied.  Files are streamed in chunks with a sha256 checksum
+    recorded in the manifest.  This needs to run on the minion where the Nexus
+    data directory is mounted.
+
+    Args:
+        name (str):
+            Directory to write the backup to
+        data_dir (str):
+            Nexus data directory on the minion
+        backup_task (str):
+            Optional: Name of the db.backup task to run (default='database-backup')
+        backup_dir (str):
+            Optional: Location of the database export relative to data_dir (default='backup')
+        blob_dir (str):
+            Optional: Location of the blob stores relative to data_dir (default='blobs')
+        compress (bool):
+            Optional: gzip the copied files (default=True)
+        prune (bool):
+            Optional: Remove files from the backup that no longer exist in Nexus (default=False)
+        chunk_size (int):
+            Optional: Size in bytes of the chunks files are copied in (default=1048576)
+        timeout (int):
+            Optional: Seconds to wait for the database backup task (default=7200)
+    Returns:
+        dict: database backup task outcome and number of files and bytes copied
+    """
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': 'Nexus backup written to: {0}'.format(name)}
+
+    if __opts__['test']:
+        manifest = _load_backup_manifest(os.path.join(name, 'manifest.jsonl'))
+        seen = set()
+        to_copy = 0
+        for source_dir in (backup_dir, blob_dir):
+            for root, dirs, files in os.walk(os.path.join(data_dir, source_dir)):
+                dirs[:] = [directory for directory in dirs if directory != 'tmp']
+                for file_name in files:
+                    source_path = os.path.join(root, file_name)
+                    path = os.path.relpath(source_path, data_dir)
+                    seen.add(path)
+                    entry = manifest.get(path)
+                    try:
+                        stat = os.stat(source_path)
+                    except OSError:
+                        continue
+                    if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                        to_copy += 1
+        ret['result'] = None
+        ret['changes'] = {'task': backup_task,
+                          'copied': to_copy,
+                          'pruned': len([path for path in manifest if path not in seen]) if prune else 0}
+        ret['comment'] = ('Task {0} would be run and {1} files would be copied to {2}'
+                          .format(backup_task, to_copy, name))
+        return ret
+
+    task_ret = task_run(backup_task, wait=True, timeout=timeout)
+    if not task_ret['result']:
+        ret['result'] = False
+        ret['comment'] = task_ret['comment']
+        return ret
+
+    if not os.path.isdir(name):
+        os.makedirs(name)
+
+    manifest_path = os.path.join(name, 'manifest.jsonl')
+    manifest = _load_backup_manifest(manifest_path)
+
+    seen = set()
+    copied = 0
+    copied_bytes = 0
+    for source_dir in (backup_dir, blob_dir):
+        for root, dirs, files in os.walk(os.path.join(data_dir, source_dir)):
+            # blobs in tmp are uploads that are still in progress
+            dirs[:] = [directory for directory in dirs if directory != 'tmp']
+            for file_name in files:
+                source_path = os.path.join(root, file_name)
+                path = os.path.relpath(source_path, data_dir)
+                seen.add(path)
+
+                try:
+                    stat = os.stat(source_path)
+                except OSError:
+                    continue
+                entry = manifest.get(path)
+                if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    continue
+
+                target_path = os.path.join(name, path + ('.gz' if compress else ''))
+                try:
+                    checksum = _backup_file(source_path, target_path, compress, chunk_size)
+                except (IOError, OSError) as e:
+                    # Files can disappear while the blob store is compacted
+                    log.warning('Failed copying {0} to backup: {1}'.format(source_path, e))
+                    continue
+
+                manifest[path] = {'path': path,
+                                  'size': stat.st_size,
+                                  'mtime': stat.st_mtime,
+                                  'sha256': checksum,
+                                  'target': os.path.relpath(target_path, name)}
+                copied += 1
+                copied_bytes += stat.st_size
+
+    pruned = 0
+    if prune:
+        for path in [path for path in manifest if path not in seen]:
+            target_path = os.path.join(name, manifest[path]['target'])
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            del manifest[path]
+            pruned += 1
+
+    _write_backup_manifest(manifest_path, manifest)
+
+    ret['changes'] = {'task': task_ret['changes'],
+                      'copied': copied,
+                      'copied_bytes': copied_bytes,
+                      'pruned': pruned}
+
+    return ret
+
+
+@_fan_out
+@_cached('capability:baseurl')
 def base_url(name):
     """
     Enable or disable anonymous access to Nexus 3
@@ -362,12 +1252,16 @@ def base_url(name):
     return results
 
 
+@_fan_out
+@_cached('blobstore:{name}')
 def blobstore(name,
               path,
               store_type='file',
               s3_bucket='',
               s3_access_key_id='',
-              s3_secret_access_key=''):
+              s3_secret_access_key='',
+              quota_type=None,
+              quota_limit=None):
     """
     Enable or disable anonymous access to Nexus 3
 
@@ -386,98 +1280,1033 @@ def blobstore(name,
             Optional: AWS Access Key for S3 bucket
         s3_secret_access_key (str):
             Optional: AWS Secret Access Key for S3 bucket
+        quota_type (str):
+            Optional: Type of soft quota.  The quota is left untouched if not set
+            Options: used or spaceUsedQuota (space used limit),
+            remaining or spaceRemainingQuota (space remaining limit) (default=None)
+        quota_limit (int):
+            Optional: Soft quota limit in megabytes (default=None)
     Returns:
         str: 'null' if successful
     """
-    script_name = 'create_blobstore'
-    script_data = nexus_groovy.create_blobstore
+    script_name = 'create_blobstore'
+    script_data = nexus_groovy.create_blobstore
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for blobstore: {1}'.format(script_name, name)}
+
+    s3_config = {'s3_bucket': s3_bucket,
+                 's3_access_key_id': s3_access_key_id,
+                 's3_secret_access_key': s3_secret_access_key}
+
+    script_args = {'name': name,
+                   'path': path,
+                   'type': store_type,
+                   'config': s3_config,
+                   'quota_type': None,
+                   'quota_limit_bytes': None}
+
+    if quota_type is not None:
+        quota_types = {'used': 'spaceUsedQuota',
+                       'remaining': 'spaceRemainingQuota',
+                       'spaceUsedQuota': 'spaceUsedQuota',
+                       'spaceRemainingQuota': 'spaceRemainingQuota'}
+        if quota_type not in quota_types:
+            ret['result'] = False
+            ret['comment'] = 'Invalid quota_type {0} for blobstore: {1}.  Options: {2}'.format(
+                quota_type, name, ', '.join(sorted(quota_types)))
+            return ret
+        if quota_limit is None:
+            ret['result'] = False
+            ret['comment'] = 'quota_limit is required when quota_type is set for blobstore: {0}'.format(name)
+            return ret
+        script_args['quota_type'] = quota_types[quota_type]
+        script_args['quota_limit_bytes'] = int(quota_limit) * 1024 * 1024
+
+    results = _script_processor(script_name, script_data, script_args, ret)
+    return results
+
+
+@_fan_out
+def blobstore_absent(name):
+    """
+    Delete a Nexus 3 blobstore if it exists.  The blobstore must not be used
+    by any repository or blobstore group
+
+    Args:
+        name (str):
+            Name of blobstore
+    Returns:
+        dict: deleted blobstore
+    """
+    script_name = 'delete_blobstore'
+    script_data = nexus_groovy.delete_blobstore
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for blobstore: {1}'.format(script_name, name)}
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Blobstore {0} would be deleted if it exists'.format(name)
+        return ret
+
+    results = _script_json(script_name, script_data, {'name': name})
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if not results:
+        ret['comment'] = 'Blobstore {0} is already absent'.format(name)
+        return ret
+
+    ret['changes'] = {'deleted': results}
+
+    return ret
+
+
+@_fan_out
+def blobstore_group(name,
+                    members,
+                    fill_policy='round_robin',
+                    delete_removed=False):
+    """
+    Create or modify Nexus 3 blobstore group
+
+    Args:
+        name (str):
+            Name of blobstore group
+        members (list):
+            List of member blobstores in write order.  A member may be the name of an
+            existing blobstore or a dictionary of name: path, in which case a file
+            blobstore is created at that path first
+        fill_policy (str):
+            Optional: How new blobs are spread across the members
+            Options: round_robin or write_to_first (default=round_robin)
+        delete_removed (bool):
+            Optional: Delete blobstores that are removed from the group.  With
+            test=True the deletions are only reported
+            Options: True or False (default=False)
+    Returns:
+        dict: old and new members and fill policy if the group changed
+    """
+    script_name = 'create_blobstore_group'
+    script_data = nexus_groovy.create_blobstore_group
+
+    fill_policy = {'round_robin': 'roundRobin',
+                   'write_to_first': 'writeToFirst'}[fill_policy]
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for blobstore group: {1}'.format(script_name, name)}
+
+    member_names = []
+    for member in members:
+        if isinstance(member, dict):
+            member_name, member_path = list(member.items())[0]
+            if not __opts__['test']:
+                member_ret = blobstore(member_name, member_path)
+                if not member_ret['result']:
+                    ret['result'] = False
+                    ret['comment'] = member_ret['comment']
+                    return ret
+        else:
+            member_name = member
+        member_names.append(member_name)
+
+    script_args = {'name': name,
+                   'members': member_names,
+                   'fill_policy': fill_policy,
+                   'dry_run': __opts__['test']}
+
+    results = _script_json(script_name, script_data, script_args)
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if not results['new']:
+        ret['comment'] = 'Blobstore group {0} is already up to date'.format(name)
+        return ret
+
+    ret['changes'] = results
+
+    removed = []
+    if delete_removed:
+        removed = [member for member in results['old'].get('members', []) if member not in member_names]
+
+    if __opts__['test']:
+        if removed:
+            ret['changes']['deleted'] = removed
+        ret['result'] = None
+        ret['comment'] = 'Blobstore group {0} would be changed'.format(name)
+        return ret
+
+    if removed:
+        for member in removed:
+            delete_ret = {'name': member, 'changes': {}, 'result': True}
+            _script_processor('delete_blobstore', nexus_groovy.delete_blobstore, {'name': member}, delete_ret)
+            if not delete_ret['result']:
+                ret['result'] = False
+                ret['comment'] = delete_ret['comment']
+                return ret
+        ret['changes']['deleted'] = removed
+
+    return ret
+
+
+@_fan_out
+def capability(name,
+               properties=None,
+               enabled=True,
+               notes=None,
+               type_id=None):
+    """
+    Create, modify, enable or disable a Nexus 3 capability
+
+    Args:
+        name (str):
+            Capability type id, for example OutreachManagementCapability,
+            analytics-configuration, healthcheck or rapture.branding
+        properties (dict):
+            Optional: Properties of the capability.  Only the given properties are
+            changed, properties that are not given keep their current value (default=None)
+        enabled (bool):
+            Optional: Enable or disable the capability (default=True)
+        notes (str):
+            Optional: Notes used to tell apart several capabilities of the same
+            type.  If not set, the first capability of the type is managed
+        type_id (str):
+            Optional: Capability type id if name is used as a unique state id instead
+    Returns:
+        dict: capability created or updated.  Unchanged capabilities report no changes
+    """
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"setup_capability" script run for capability: {0}'.format(name)}
+
+    definition = {'type_id': type_id or name,
+                  'properties': properties,
+                  'enabled': enabled,
+                  'notes': notes}
+
+    results = capabilities(name, [definition])
+    ret['result'] = results['result']
+    ret['changes'] = results['changes']
+    if results['result'] is None:
+        ret['comment'] = 'Capability {0} would be changed'.format(name)
+    elif not results['result']:
+        ret['comment'] = results['comment']
+    elif not results['changes']:
+        ret['comment'] = 'Capability {0} is already up to date'.format(name)
+
+    return ret
+
+
+@_fan_out
+def capabilities(name,
+                 capabilities,
+                 chunk_size=100):
+    """
+    Create, modify, enable or disable Nexus 3 capabilities in bulk.  Capabilities
+    whose enabled flag and properties already match are not written
+
+    Args:
+        name (str):
+            Name of the capability set.  Only used in the return message
+        capabilities (list):
+            List of capabilities with a type_id and optional properties (dict),
+            enabled (bool, default True) and notes
+        chunk_size (int):
+            Optional: Number of capabilities applied per script run (default=100)
+    Returns:
+        dict: lists of created and updated capabilities
+    """
+    script_name = 'setup_capability'
+    script_data = nexus_groovy.setup_capability
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for capabilities: {1}'.format(script_name, name)}
+
+    definitions = ({'capability_typeId': definition['type_id'],
+                    'capability_properties': definition.get('properties'),
+                    'capability_enabled': definition.get('enabled', True),
+                    'notes': definition.get('notes')}
+                   for definition in capabilities)
+
+    changes = {'created': [], 'updated': []}
+    for chunk in _chunks(definitions, chunk_size):
+        results = _script_json(script_name, script_data, {'capabilities': chunk, 'dry_run': __opts__['test']})
+        if results is None:
+            ret['result'] = False
+            ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+            break
+        for action in changes:
+            changes[action].extend(results[action])
+
+    ret['changes'] = dict((action, names) for action, names in changes.items() if names)
+
+    if __opts__['test'] and ret['result'] and ret['changes']:
+        ret['result'] = None
+        ret['comment'] = 'Capabilities {0} would be changed'.format(name)
+
+    return ret
+
+
+@_fan_out
+@_cached('cleanup_policy:{name}')
+def cleanup_policy(name,
+                   format='all',
+                   notes='',
+                   last_blob_updated=None,
+                   last_downloaded=None,
+                   prerelease=None,
+                   regex=None):
+    """
+    Create or modify a Nexus 3 cleanup policy.  Components matching all of the
+    criteria that are set are removed by the cleanup task of the repositories the
+    policy is attached to (see cleanup_policies on repo_hosted and repo_proxy)
+
+    Args:
+        name (str):
+            Name of the cleanup policy
+        format (str):
+            Optional: Repository format the policy applies to
+            Options: all,maven,yum,npm,raw,pypi,nuget,rubygems,docker,bower (default=all)
+        notes (str):
+            Optional: Notes about the policy (default='')
+        last_blob_updated (int):
+            Optional: Remove components published more than this many days ago
+        last_downloaded (int):
+            Optional: Remove components not downloaded in this many days
+        prerelease (bool):
+            Optional: Remove only prerelease (True) or only release (False) components
+        regex (str):
+            Optional: Remove only components whose asset path matches this regular expression
+    Returns:
+        dict: action taken (created, updated) and the criteria of the policy.
+              Unchanged policies report no changes
+    """
+    script_name = 'create_cleanup_policy'
+    script_data = nexus_groovy.create_cleanup_policy
+
+    policy_format = {'all': 'ALL_FORMATS',
+                     'maven': 'maven2'}.get(format, format)
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for cleanup policy: {1}'.format(script_name, name)}
+
+    script_args = {'name': name,
+                   'format': policy_format,
+                   'notes': notes,
+                   'last_blob_updated': last_blob_updated,
+                   'last_downloaded': last_downloaded,
+                   'prerelease': prerelease,
+                   'regex': regex}
+
+    results = _script_json(script_name, script_data, script_args)
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if results['action'] == 'unchanged':
+        ret['comment'] = 'Cleanup policy {0} is already up to date'.format(name)
+        return ret
+
+    ret['changes'] = results
+
+    return ret
+
+
+@_fan_out
+def content_selectors(name,
+                      selectors,
+                      chunk_size=500):
+    """
+    Create or modify Nexus 3 content selectors in bulk
+
+    Selectors whose description and search expression already match are
+    not written.
+
+    Args:
+        name (str):
+            Name of the selector set.  Only used in the return message
+        selectors (dict):
+            Dictionary of selector name to description and search_expression
+            (CSEL expression, for example format == "maven2" and path =^ "/org/example/")
+        chunk_size (int):
+            Optional: Number of selectors applied per script run (default=500)
+    Returns:
+        dict: lists of created and updated selectors
+    """
+    script_name = 'create_content_selector'
+    script_data = nexus_groovy.create_content_selector
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for content selectors: {1}'.format(script_name, name)}
+
+    definitions = ({'name': selector_name,
+                    'description': definition.get('description', ''),
+                    'search_expression': definition['search_expression']}
+                   for selector_name, definition in selectors.items())
+
+    changes = {'created': [], 'updated': []}
+    for chunk in _chunks(definitions, chunk_size):
+        results = _script_json(script_name, script_data, {'selectors': chunk, 'dry_run': __opts__['test']})
+        if results is None:
+            ret['result'] = False
+            ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+            break
+        for action in changes:
+            changes[action].extend(results[action])
+
+    ret['changes'] = dict((action, names) for action, names in changes.items() if names)
+
+    if __opts__['test'] and ret['result'] and ret['changes']:
+        ret['result'] = None
+        ret['comment'] = 'Content selectors {0} would be changed'.format(name)
+
+    return ret
+
+
+@_fan_out
+@_cached('email')
+def email_server(name,
+                 email_server_port,
+                 email_server_enabled=True,
+                 email_server_username=None,
+                 email_server_password=None,
+                 email_from_address='nexus@example.org',
+                 email_subject_prefix='Nexus: ',
+                 email_tls_enabled=True,
+                 email_tls_required=False,
+                 email_ssl_on_connect_enabled=True,
+                 email_ssl_check_server_identity_enabled=True,
+                 email_trust_store_enabled=False):
+    """
+    Setup SMTP servers for Nexus to send emails through
+
+    Args:
+        name (str):
+            Hostname or IP address of SMTP server
+        email_server_enabled (bool):
+            Enable email server
+            Options: True or False (default=True)
+        email_server_port (int):
+            Port of SMTP server
+        email_server_username (str):
+            Username for SMTP server (default=None)
+        email_server_password (str):
+            Password for SMTP servers (default=None)
+        email_from_address (str):
+            Set from address for emails from Nexus (default='nexus@example.org')
+        email_subject_prefix (str):
+            Set subject prefix for emails from Nexus (default='Nexus: '
+        email_tls_enabled (bool):
+            Enable STARTTLS support for insecure connections (default=True)
+        email_tls_required (bool):
+            Require STARTTLS support (default=False)
+        email_ssl_on_connect_enabled (bool):
+            Enable SSL/TLS encryption upon connection (default=True)
+        email_ssl_check_server_identity_enabled (bool):
+            Enable server identity check (default=True)
+        email_trust_store_enabled (bool):
+            Use certificates stored in the Nexus truststore to connect to external systems (default=False)
+
+    """
+    script_name = 'setup_email'
+    script_data = nexus_groovy.setup_email
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for core configurations: {1}'.format(script_name, name)}
+
+    script_args = {'email_server_host': name,
+                   'email_server_enabled': email_server_enabled,
+                   'email_server_port': email_server_port,
+                   'email_server_username': email_server_username,
+                   'email_server_password': email_server_password,
+                   'email_from_address': email_from_address,
+                   'email_subject_prefix': email_subject_prefix,
+                   'email_tls_enabled': email_tls_enabled,
+                   'email_tls_required': email_tls_required,
+                   'email_ssl_on_connect_enabled': email_ssl_on_connect_enabled,
+                   'email_ssl_check_server_identity_enabled': email_ssl_check_server_identity_enabled,
+                   'email_trust_store_enabled': email_trust_store_enabled}
+
+    results = _script_processor(script_name, script_data, script_args, ret)
+    return results
+
+
+@_fan_out
+@_cached('http_proxy')
+def http_proxy(name,
+               http_proxy_host=None,
+               http_proxy_port=None,
+               http_proxy_username=None,
+               http_proxy_password=None,
+               https_proxy_host=None,
+               https_proxy_port=None,
+               https_proxy_username=None,
+               https_proxy_password=None,
+               non_proxy_hosts=None):
+    """
+    Configure the outbound HTTP and HTTPS proxy used by Nexus.  Only the parts of
+    the proxy configuration that differ from the current configuration are changed
+
+    Args:
+        name (str):
+            This string can be completely random.
+            It is not used anywhere except in the return message.
+        http_proxy_host (str):
+            Optional: Host of the HTTP proxy.  The HTTP proxy is removed if not set
+        http_proxy_port (int):
+            Optional: Port of the HTTP proxy
+        http_proxy_username (str):
+            Optional: Username if the HTTP proxy requires authentication
+        http_proxy_password (str):
+            Optional: Password if the HTTP proxy requires authentication
+        https_proxy_host (str):
+            Optional: Host of the HTTPS proxy.  The HTTPS proxy is removed if not set
+        https_proxy_port (int):
+            Optional: Port of the HTTPS proxy
+        https_proxy_username (str):
+            Optional: Username if the HTTPS proxy requires authentication
+        https_proxy_password (str):
+            Optional: Password if the HTTPS proxy requires authentication
+        non_proxy_hosts (list):
+            Optional: Hosts that are connected to directly instead of through the
+            proxy, for example upstreams on the local network (wildcards like
+            *.example.com are allowed)
+    Returns:
+        dict: old and new values of the parts of the proxy configuration that changed
+    """
+    script_name = 'setup_http_proxy'
+    script_data = nexus_groovy.setup_http_proxy
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for http proxy: {1}'.format(script_name, name)}
+
+    script_args = {'with_http_proxy': bool(http_proxy_host),
+                   'http_proxy_host': http_proxy_host,
+                   'http_proxy_port': http_proxy_port,
+                   'http_proxy_username': http_proxy_username,
+                   'http_proxy_password': http_proxy_password,
+                   'with_https_proxy': bool(https_proxy_host),
+                   'https_proxy_host': https_proxy_host,
+                   'https_proxy_port': https_proxy_port,
+                   'https_proxy_username': https_proxy_username,
+                   'https_proxy_password': https_proxy_password,
+                   'proxy_exclude_hosts': non_proxy_hosts or [],
+                   'dry_run': __opts__['test']}
+
+    results = _script_json(script_name, script_data, script_args)
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if not results['new']:
+        ret['comment'] = 'HTTP proxy configuration is already up to date'
+        return ret
+
+    ret['changes'] = results
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'HTTP proxy configuration would be changed'
+
+    return ret
+
+
+@_fan_out
+@_cached('ldap:{name}')
+def ldap(name,
+         hostname,
+         search_base,
+         user_base_dn='',
+         port=389,
+         protocol='ldap',
+         auth='none',
+         username=None,
+         password=None,
+         user_ldap_filter='',
+         user_object_class='inetOrgPerson',
+         user_id_attribute='uid',
+         user_real_name_attribute='cn',
+         user_email_attribute='mail',
+         user_subtree=False,
+         map_groups_as_roles=False,
+         map_groups_as_roles_type='static',
+         group_base_dn='',
+         group_object_class='groupOfNames',
+         group_id_attribute='cn',
+         group_member_attribute='member',
+         group_member_format='${dn}',
+         group_subtree=False,
+         user_memberof_attribute='memberOf',
+         connection_timeout=30,
+         connection_retry_delay=300,
+         max_incidents_count=3,
+         backup_hostname=None,
+         backup_port=389,
+         backup_protocol='ldap',
+         use_trust_store=None,
+         order=None):
+    """
+    Create or modify a Nexus 3 LDAP server
+
+    Args:
+        name (str):
+            Name of the LDAP server configuration
+        hostname (str):
+            Hostname of the LDAP server
+        search_base (str):
+            LDAP location to be added to the connection URL (ie dc=example,dc=com)
+        user_base_dn (str):
+            Optional: Location relative to search_base where users are found (default='')
+        port (int):
+            Optional: Port of the LDAP server (default=389)
+        protocol (str):
+            Optional: Options: ldap or ldaps (default=ldap)
+        auth (str):
+            Optional: Authentication method
+            Options: none or simple (default=none)
+        username (str):
+            Optional: Username or DN to bind with when auth is simple
+        password (str):
+            Optional: Password to bind with when auth is simple
+        user_ldap_filter (str):
+            Optional: LDAP filter to limit user search (default='')
+        user_object_class (str):
+            Optional: Object class of users (default=inetOrgPerson)
+        user_id_attribute (str):
+            Optional: Attribute holding the user id (default=uid)
+        user_real_name_attribute (str):
+            Optional: Attribute holding the real name of users (default=cn)
+        user_email_attribute (str):
+            Optional: Attribute holding the email address of users (default=mail)
+        user_subtree (bool):
+            Optional: Search users in subtrees of user_base_dn (default=False)
+        map_groups_as_roles (bool):
+            Optional: Map LDAP groups to Nexus roles (default=False)
+        map_groups_as_roles_type (str):
+            Optional: Options: static or dynamic (default=static)
+        group_base_dn (str):
+            Optional: Location relative to search_base where groups are found (default='')
+        group_object_class (str):
+            Optional: Object class of static groups (default=groupOfNames)
+        group_id_attribute (str):
+            Optional: Attribute holding the group id (default=cn)
+        group_member_attribute (str):
+            Optional: Attribute holding the members of static groups (default=member)
+        group_member_format (str):
+            Optional: Format of the member attribute (default=${dn})
+        group_subtree (bool):
+            Optional: Search groups in subtrees of group_base_dn (default=False)
+        user_memberof_attribute (str):
+            Optional: Attribute holding the groups of users for dynamic groups (default=memberOf)
+        connection_timeout (int):
+            Optional: Seconds to wait for the LDAP server before failing a login (default=30)
+        connection_retry_delay (int):
+            Optional: Seconds to wait before retrying a failed server (default=300)
+        max_incidents_count (int):
+            Optional: Failed connections before the server is blacklisted for
+            connection_retry_delay seconds (default=3)
+        backup_hostname (str):
+            Optional: Hostname of a backup LDAP server used when the server is unavailable
+        backup_port (int):
+            Optional: Port of the backup LDAP server (default=389)
+        backup_protocol (str):
+            Optional: Options: ldap or ldaps (default=ldap)
+        use_trust_store (bool):
+            Optional: Use the Nexus truststore for ldaps connections
+        order (int):
+            Optional: Position of the server in the list of LDAP servers Nexus
+            consults in order, starting at 0
+    Returns:
+        str: 'null' if successful
+    """
+    script_name = 'setup_ldap'
+    script_data = nexus_groovy.setup_ldap
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for ldap server: {1}'.format(script_name, name)}
+
+    if order is not None and int(order) < 0:
+        ret['result'] = False
+        ret['comment'] = 'order must be 0 or greater for ldap server: {0}'.format(name)
+        return ret
+
+    script_args = {'name': name,
+                   'hostname': hostname,
+                   'port': port,
+                   'protocol': protocol,
+                   'auth': auth,
+                   'username': username,
+                   'password': password,
+                   'search_base': search_base,
+                   'user_base_dn': user_base_dn,
+                   'user_ldap_filter': user_ldap_filter,
+                   'user_object_class': user_object_class,
+                   'user_id_attribute': user_id_attribute,
+                   'user_real_name_attribute': user_real_name_attribute,
+                   'user_email_attribute': user_email_attribute,
+                   'user_subtree': user_subtree,
+                   'map_groups_as_roles': map_groups_as_roles,
+                   'map_groups_as_roles_type': map_groups_as_roles_type,
+                   'group_base_dn': group_base_dn,
+                   'group_object_class': group_object_class,
+                   'group_id_attribute': group_id_attribute,
+                   'group_member_attribute': group_member_attribute,
+                   'group_member_format': group_member_format,
+                   'group_subtree': group_subtree,
+                   'user_memberof_attribute': user_memberof_attribute,
+                   'connection_timeout': connection_timeout,
+                   'connection_retry_delay': connection_retry_delay,
+                   'max_incidents_count': max_incidents_count,
+                   'backup_hostname': backup_hostname,
+                   'backup_port': backup_port,
+                   'backup_protocol': backup_protocol,
+                   'use_trust_store': use_trust_store,
+                   'order': order}
+
+    results = _script_processor(script_name, script_data, script_args, ret)
+
+    return results
+
+
+@_fan_out
+def lease(name,
+          version=None,
+          ttl=1800,
+          wait=300):
+    """
+    Take a lease on the Nexus 3 node so only one minion configures it at a time.
+    A minion that finds the lease held by another minion waits for it to be
+    released, if it is still held after wait seconds the remaining nexus3
+    configuration states of the run fail without being applied.  When the
+    node already has the configuration version applied, the lease is not
+    taken and the remaining nexus3 configuration states of the run are
+    skipped.  task_run and backup always run.  Release the lease with nexus3.lease_release at the end of the run.
+
+    The lease is kept in memory on the Nexus node, so it is forgotten when
+    Nexus restarts and the next run applies the configuration again.
+
+    Args:
+        name (str):
+            Name of the lease, minions configuring the same node use the same name
+        version (str):
+            Optional: Version of the configuration, i.e. a hash of the pillar data (default=None)
+        ttl (int):
+            Optional: Seconds after which an unreleased lease expires (default=1800)
+        wait (int):
+            Optional: Seconds to wait for a lease held by another minion (default=300)
+    Returns:
+        str: status and owner of the lease
+    """
+    script_name = 'setup_lease'
+    script_data = nexus_groovy.setup_lease
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for lease: {1}'.format(script_name, name)}
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Lease {0} would be acquired'.format(name)
+        return ret
+
+    script_args = {'name': name,
+                   'action': 'acquire',
+                   'owner': __opts__['id'],
+                   'version': version,
+                   'ttl': ttl}
+
+    deadline = time.time() + wait
+    delay = 1
+    while True:
+        results = _script_json(script_name, script_data, script_args)
+        if results is None:
+            ret['result'] = False
+            ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+            return ret
+        if results['status'] != 'held' or time.time() >= deadline:
+            break
+        log.info('Lease {0} is held by {1}, waiting'.format(name, results['owner']))
+        time.sleep(min(delay, max(deadline - time.time(), 0)))
+        delay = min(delay * 2, 30)
+
+    __context__['nexus3.lease.{0}'.format(_connection_info()['host'])] = results
+    if results['status'] == 'held':
+        ret['result'] = False
+        ret['comment'] = 'Lease {0} is held by minion {1}'.format(name, results['owner'])
+    elif results['status'] == 'applied':
+        ret['comment'] = ('Configuration version {0} is already applied, '
+                          'skipping the remaining nexus3 configuration states'.format(version))
+    else:
+        ret['comment'] = 'Lease {0} acquired'.format(name)
+
+    return ret
+
+
+@_fan_out
+def lease_release(name,
+                  version=None):
+    """
+    Release a lease taken with nexus3.lease and record the configuration version
+    as applied.  The version is not recorded if a nexus3 state of the run failed.
+    Should run after all other nexus3 states, i.e. with order: last
+
+    Args:
+        name (str):
+            Name of the lease
+        version (str):
+            Optional: Version of the configuration that was applied (default=None)
+    Returns:
+        str: status of the lease
+    """
+    script_name = 'setup_lease'
+    script_data = nexus_groovy.setup_lease
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for lease: {1}'.format(script_name, name)}
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Lease {0} would be released'.format(name)
+        return ret
+
+    # __running__ holds the results of the states run so far
+    failed = [tag for tag, result in globals().get('__running__', {}).items()
+              if tag.startswith('nexus3_') and result.get('result') is False]
+    if failed:
+        log.warning('Not recording version {0} as applied, {1} nexus3 states failed'.format(version, len(failed)))
+        version = None
+
+    results = _script_json(script_name, script_data, {'name': name,
+                                                      'action': 'release',
+                                                      'owner': __opts__['id'],
+                                                      'version': version})
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    __context__.pop('nexus3.lease.{0}'.format(_connection_info()['host']), None)
+    if results['status'] == 'released':
+        ret['comment'] = 'Lease {0} released'.format(name)
+        if version is not None:
+            ret['comment'] += ', version {0} applied'.format(version)
+    else:
+        ret['comment'] = 'Lease {0} is not held by this minion'.format(name)
+
+    return ret
+
+
+@_fan_out
+def privileges(name,
+               privileges,
+               chunk_size=500):
+    """
+    Create or modify Nexus 3 privileges in bulk
+
+    Existing privileges are listed once per script run and privileges that are
+    already up to date are not written, so the security caches are not flushed.
+
+    Args:
+        name (str):
+            Name of the privilege set.  Only used in the return message
+        privileges (list):
+            List of privilege definitions.  A definition has a name, description and
+            type (repository-view, repository-content-selector, repository-admin,
+            application or wildcard) and either the properties dictionary of the
+            privilege or the format, repository, contentSelector, pattern, domain
+            and actions (list) keys
+        chunk_size (int):
+            Optional: Number of privileges applied per script run (default=500)
+    Returns:
+        dict: lists of created and updated privileges
+    """
+    script_name = 'setup_privilege'
+    script_data = nexus_groovy.setup_privilege
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for privileges: {1}'.format(script_name, name)}
+
+    changes = {'created': [], 'updated': []}
+    for chunk in _chunks(privileges, chunk_size):
+        results = _script_json(script_name, script_data, {'privileges': chunk, 'dry_run': __opts__['test']})
+        if results is None:
+            ret['result'] = False
+            ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+            break
+        for action in changes:
+            changes[action].extend(results[action])
+
+    ret['changes'] = dict((action, names) for action, names in changes.items() if names)
+
+    if __opts__['test'] and ret['result'] and ret['changes']:
+        ret['result'] = None
+        ret['comment'] = 'Privileges {0} would be changed'.format(name)
+
+    return ret
+
+
+@_fan_out
+def prune_unmanaged(name,
+                    repositories=None,
+                    blob_stores=None,
+                    keep_repositories=None,
+                    keep_blob_stores=('default',)):
+    """
+    Delete repositories and blobstores that are not managed by Salt
 
+    Given the full set of managed repositories and/or blobstores, everything else
+    is deleted with one batched script run per kind.  Repositories are deleted
+    first so the blobstores they used can be deleted afterwards.  Blobstores still
+    used by a repository or blobstore group are never deleted.  Run with test=True
+    for a report of what would be deleted.
+
+    Args:
+        name (str):
+            This string can be completely random.
+            It is not used anywhere except in the return message.
+        repositories (list):
+            Optional: Names of all managed repositories.  Repositories are not
+            pruned if not set
+        blob_stores (list):
+            Optional: Names of all managed blobstores.  Blobstores are not
+            pruned if not set
+        keep_repositories (list):
+            Optional: Unmanaged repositories that are never deleted
+        keep_blob_stores (list):
+            Optional: Unmanaged blobstores that are never deleted (default=['default'])
+    Returns:
+        dict: deleted repositories and blobstores
+    """
     ret = {'name': name,
            'changes': {},
            'result': True,
-           'comment': '"{0}" script run for blobstore: {1}'.format(script_name, name)}
-
-    s3_config = {'s3_bucket': s3_bucket,
-                 's3_access_key_id': s3_access_key_id,
-                 's3_secret_access_key': s3_secret_access_key}
+           'comment': 'Unmanaged repositories and blobstores pruned: {0}'.format(name)}
 
-    script_args = {'name': name,
-                   'path': path,
-                   'type': store_type,
-                   'config': s3_config}
+    existing_repositories = _script_json('get_repositories', nexus_groovy.get_repositories, {})
+    existing_blob_stores = _script_json('get_blobstore_metrics', nexus_groovy.get_blobstore_metrics, {})
+    if existing_repositories is None or existing_blob_stores is None:
+        ret['result'] = False
+        ret['comment'] = 'Unable to list repositories and blobstores.  See minion logs for details.'
+        return ret
+    existing_blob_stores = existing_blob_stores['blob_stores']
+
+    unmanaged_repositories = []
+    if repositories is not None:
+        keep = set(repositories) | set(keep_repositories or [])
+        unmanaged_repositories = sorted(repo for repo in existing_repositories if repo not in keep)
+
+    unmanaged_blob_stores = []
+    if blob_stores is not None:
+        in_use = set(existing_repositories[repo]['blob_store'] for repo in existing_repositories
+                     if repo not in unmanaged_repositories)
+        for store in existing_blob_stores.values():
+            in_use.update(store.get('members') or [])
+        keep = set(blob_stores) | set(keep_blob_stores or []) | in_use
+        unmanaged_blob_stores = sorted(store for store in existing_blob_stores if store not in keep)
+
+    if __opts__['test']:
+        ret['result'] = None if unmanaged_repositories or unmanaged_blob_stores else True
+        ret['comment'] = 'Would delete repositories: {0} and blobstores: {1}'.format(
+            unmanaged_repositories, unmanaged_blob_stores)
+        ret['changes'] = {'repositories': unmanaged_repositories, 'blob_stores': unmanaged_blob_stores}
+        return ret
+
+    for kind, script_name, names in (('repositories', 'delete_repo', unmanaged_repositories),
+                                     ('blob_stores', 'delete_blobstore', unmanaged_blob_stores)):
+        if not names:
+            continue
+        results = _script_json(script_name, getattr(nexus_groovy, script_name), {'names': names})
+        if results is None:
+            ret['result'] = False
+            ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+            return ret
+        ret['changes'][kind] = results
 
-    results = _script_processor(script_name, script_data, script_args, ret)
-    return results
+    return ret
 
 
-def email_server(name,
-                 email_server_port,
-                 email_server_enabled=True,
-                 email_server_username=None,
-                 email_server_password=None,
-                 email_from_address='nexus@example.org',
-                 email_subject_prefix='Nexus: ',
-                 email_tls_enabled=True,
-                 email_tls_required=False,
-                 email_ssl_on_connect_enabled=True,
-                 email_ssl_check_server_identity_enabled=True,
-                 email_trust_store_enabled=False):
+@_fan_out
+@_cached('realms')
+def realm_order(name,
+                realms):
     """
-    Setup SMTP servers for Nexus to send emails through
+    Set the complete ordered list of active authentication realms in Nexus.
+    Realms are consulted in order, so local realms should usually come before
+    LdapRealm to avoid an LDAP round trip for local accounts.  Realms that are
+    not listed are disabled.
 
     Args:
         name (str):
-            Hostname or IP address of SMTP server
-        email_server_enabled (bool):
-            Enable email server
-            Options: True or False (default=True)
-        email_server_port (int):
-            Port of SMTP server
-        email_server_username (str):
-            Username for SMTP server (default=None)
-        email_server_password (str):
-            Password for SMTP servers (default=None)
-        email_from_address (str):
-            Set from address for emails from Nexus (default='nexus@example.org')
-        email_subject_prefix (str):
-            Set subject prefix for emails from Nexus (default='Nexus: '
-        email_tls_enabled (bool):
-            Enable STARTTLS support for insecure connections (default=True)
-        email_tls_required (bool):
-            Require STARTTLS support (default=False)
-        email_ssl_on_connect_enabled (bool):
-            Enable SSL/TLS encryption upon connection (default=True)
-        email_ssl_check_server_identity_enabled (bool):
-            Enable server identity check (default=True)
-        email_trust_store_enabled (bool):
-            Use certificates stored in the Nexus truststore to connect to external systems (default=False)
-
+            Name of the realm chain.  Only used in the return message
+        realms (list):
+            Ordered list of realms
+            Options: NexusAuthenticatingRealm, NexusAuthorizingRealm, NuGetApiKey,
+                     NpmToken, rutauth-realm, LdapRealm, DockerToken
+    Returns:
+        dict: old and new realm order if the order changed
     """
-    script_name = 'setup_email'
-    script_data = nexus_groovy.setup_email
+    script_name = 'setup_realm_order'
+    script_data = nexus_groovy.setup_realm_order
 
     ret = {'name': name,
            'changes': {},
            'result': True,
-           'comment': '"{0}" script run for core configurations: {1}'.format(script_name, name)}
+           'comment': '"{0}" script run for realms: {1}'.format(script_name, name)}
 
-    script_args = {'email_server_host': name,
-                   'email_server_enabled': email_server_enabled,
-                   'email_server_port': email_server_port,
-                   'email_server_username': email_server_username,
-                   'email_server_password': email_server_password,
-                   'email_from_address': email_from_address,
-                   'email_subject_prefix': email_subject_prefix,
-                   'email_tls_enabled': email_tls_enabled,
-                   'email_tls_required': email_tls_required,
-                   'email_ssl_on_connect_enabled': email_ssl_on_connect_enabled,
-                   'email_ssl_check_server_identity_enabled': email_ssl_check_server_identity_enabled,
-                   'email_trust_store_enabled': email_trust_store_enabled}
+    if 'NexusAuthenticatingRealm' not in realms:
+        log.warning('NexusAuthenticatingRealm is not in the realm order, local users will not be able to log in')
 
-    results = _script_processor(script_name, script_data, script_args, ret)
-    return results
+    results = _script_json(script_name, script_data, {'realms': realms, 'dry_run': __opts__['test']})
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if not results['new']:
+        ret['comment'] = 'Realm order is already up to date'
+        return ret
+
+    ret['changes'] = results
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Realm order would be changed'
+
+    return ret
 
 
+@_fan_out
 def realms(name,
            status):
     """
@@ -509,6 +2338,47 @@ def realms(name,
     return results
 
 
+@_fan_out
+def repo_absent(name):
+    """
+    Delete a Nexus 3 repository if it exists
+
+    Args:
+        name (str):
+            Name of repository
+    Returns:
+        dict: deleted repository
+    """
+    script_name = 'delete_repo'
+    script_data = nexus_groovy.delete_repo
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for repo: {1}'.format(script_name, name)}
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Repo {0} would be deleted if it exists'.format(name)
+        return ret
+
+    results = _script_json(script_name, script_data, {'name': name})
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if not results:
+        ret['comment'] = 'Repo {0} is already absent'.format(name)
+        return ret
+
+    ret['changes'] = {'deleted': results}
+
+    return ret
+
+
+@_fan_out
+@_cached('repository:{name}')
 def repo_group(name,
                repo_type,
                member_repos,
@@ -574,6 +2444,8 @@ def repo_group(name,
     return results
 
 
+@_fan_out
+@_cached('repository:{name}')
 def repo_hosted(name,
                 repo_type,
                 docker_http_port=None,
@@ -585,7 +2457,8 @@ def repo_hosted(name,
                 yum_deploy_policy='strict',
                 write_policy='allow',
                 blob_store='default',
-                strict_content_validation=True):
+                strict_content_validation=True,
+                cleanup_policies=None):
     """
     Create or modify Nexus 3 hosted repository
     Args:
@@ -616,11 +2489,16 @@ def repo_hosted(name,
         write_policy (str):
             Optional: Controls if deployments of and updates to artifacts are allowed
             Options: allow, allow_once, deny (default=allow)
-        blob_store (list):
-            Optional: Blob store used to store asset content (default='default')
+        blob_store (str or list):
+            Optional: Blob store used to store asset content.  If a list of blob stores
+            is given, new repositories are placed on the member with the most free space
+            (default='default')
         strict_content_validation (bool):
             Optional: Validate that all content uploaded to this repository is of a MIME type appropriate
             for the repository format (default=True)
+        cleanup_policies (list):
+            Optional: Names of the cleanup policies applied to this repository.  The
+            cleanup policies of existing repositories are left untouched if not set
     Returns:
         str: RepositoryImpl$$EnhancerByGuice$$dc09c205{type=hosted, format=<repo format>, name='<name of repo>'} if
             successful
@@ -642,6 +2520,12 @@ def repo_hosted(name,
            'result': True,
            'comment': '"{0}" script run for repo: {1}'.format(script_name, name)}
 
+    blob_store = _select_blob_store(name, blob_store)
+    if blob_store is None:
+        ret['result'] = False
+        ret['comment'] = 'Unable to select a blob store for repo: {0}.  See minion logs for details.'.format(name)
+        return ret
+
     script_args = {'name': name,
                    'recipe_name': recipe_name,
                    'docker_http_port': docker_http_port,
@@ -653,13 +2537,16 @@ def repo_hosted(name,
                    'yum_deploy_policy': yum_deploy_policy,
                    'write_policy': write_policy,
                    'blob_store': blob_store,
-                   'strict_content_validation': strict_content_validation}
+                   'strict_content_validation': strict_content_validation,
+                   'cleanup_policies': cleanup_policies}
 
     results = _script_processor(script_name, script_data, script_args, ret)
 
     return results
 
 
+@_fan_out
+@_cached('repository:{name}')
 def repo_proxy(name,
                repo_type,
                remote_url,
@@ -675,7 +2562,8 @@ def repo_proxy(name,
                blob_store='default',
                strict_content_validation=True,
                remote_username=None,
-               remote_password=None):
+               remote_password=None,
+               cleanup_policies=None):
     """
     Create or modify Nexus 3 proxy repository
     Args:
@@ -712,11 +2600,16 @@ def repo_proxy(name,
         docker_use_nexus_certificates_to_access_index (bool):
             Optional: Specify to use Nexus certificate store
             Options: True or False (default=False)
-        blob_store (list):
-            Optional: Blob store used to store asset content (default='default')
+        blob_store (str or list):
+            Optional: Blob store used to store asset content.  If a list of blob stores
+            is given, new repositories are placed on the member with the most free space
+            (default='default')
         strict_content_validation (bool):
             Optional: Validate that all content uploaded to this repository is of a MIME type appropriate
             for the repository format (default=True)
+        cleanup_policies (list):
+            Optional: Names of the cleanup policies applied to this repository.  The
+            cleanup policies of existing repositories are left untouched if not set
         remote_username (str):
             Optional: username if remote_url requires authentication
         remote_password (str):
@@ -742,6 +2635,12 @@ def repo_proxy(name,
            'result': True,
            'comment': '"{0}" script run for repo: {1}'.format(script_name, name)}
 
+    blob_store = _select_blob_store(name, blob_store)
+    if blob_store is None:
+        ret['result'] = False
+        ret['comment'] = 'Unable to select a blob store for repo: {0}.  See minion logs for details.'.format(name)
+        return ret
+
     script_args = {'name': name,
                    'recipe_name': recipe_name,
                    'docker_http_port': docker_http_port,
@@ -757,13 +2656,16 @@ def repo_proxy(name,
                    'blob_store': blob_store,
                    'strict_content_validation': strict_content_validation,
                    'remote_username': remote_username,
-                   'remote_password': remote_password}
+                   'remote_password': remote_password,
+                   'cleanup_policies': cleanup_policies}
 
     results = _script_processor(script_name, script_data, script_args, ret)
 
     return results
 
     
+@_fan_out
+@_cached('role:{name}')
 def role(name,
          description,
          privileges,
@@ -782,7 +2684,8 @@ def role(name,
             list of role(s) for new role.
             this is required for some reason I don't understand
     Returns:
-        str: 'null' if successful
+        dict: old and new values of the attributes that changed.
+              Unchanged roles are not written and report no changes
     """
     script_name = 'setup_role'
     script_data = nexus_groovy.setup_role
@@ -796,18 +2699,115 @@ def role(name,
                    'name': name,
                    'description': description,
                    'privileges': privileges,
-                   'roles': base_roles}
+                   'roles': base_roles,
+                   'dry_run': __opts__['test']}
 
-    results = _script_processor(script_name, script_data, script_args, ret)
+    results = _script_json(script_name, script_data, script_args)
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
 
-    return results
+    if name not in results:
+        ret['comment'] = 'Role {0} is already up to date'.format(name)
+        return ret
+
+    ret['changes'] = {'old': results[name]['old'],
+                      'new': results[name]['new']}
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Role {0} would be changed'.format(name)
+
+    return ret
+
+
+@_fan_out
+def roles(name,
+          roles,
+          chunk_size=200):
+    """
+    Create or modify Nexus 3 user roles in bulk
+
+    Existing roles are listed once per script run and only roles whose name,
+    description, privileges or base roles differ are written.
+
+    Args:
+        name (str):
+            Name of the role set.  Only used in the return message
+        roles (dict):
+            Dictionary of role id to name (defaults to the id), description,
+            privileges and base_roles (the same format as the nexus:roles pillar)
+        chunk_size (int):
+            Optional: Number of roles applied per script run (default=200)
+    Returns:
+        dict: old and new values of the changed attributes for each role
+    """
+    script_name = 'setup_role'
+    script_data = nexus_groovy.setup_role
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for roles: {1}'.format(script_name, name)}
+
+    definitions = ({'id': role_id,
+                    'name': definition.get('name', role_id),
+                    'description': definition.get('description'),
+                    'privileges': definition.get('privileges'),
+                    'roles': definition.get('base_roles')}
+                   for role_id, definition in roles.items())
+
+    for chunk in _chunks(definitions, chunk_size):
+        results = _script_json(script_name, script_data, {'role_definitions': chunk, 'dry_run': __opts__['test']})
+        if results is None:
+            ret['result'] = False
+            ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+            break
+        ret['changes'].update(results)
+
+    if __opts__['test'] and ret['result'] and ret['changes']:
+        ret['result'] = None
+        ret['comment'] = 'Roles {0} would be changed'.format(name)
+
+    return ret
 
 
+def _wait_for_task(name, last_run_started, timeout):
+    """
+    Polls the task scheduler with backoff until a run of the task that started
+    after last_run_started has finished or the timeout (seconds) expires.
+    Returns the task metadata from get_tasks or None on timeout or error
+    """
+    deadline = time.time() + timeout
+    delay = 1
+    while True:
+        tasks = _script_json('get_tasks', nexus_groovy.get_tasks, {'names': [name]})
+        if tasks is None or name not in tasks:
+            return None
+
+        info = tasks[name]
+        if info['run_state'] is None and info['last_run_started'] != last_run_started and info['last_run_result']:
+            return info
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            log.error('Timed out waiting for task: {0}'.format(name))
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 30)
+
+
+@_fan_out
+@_cached('task:{name}')
 def task(name,
          task_type_id,
          task_properties,
          task_cron,
-         task_alert_email=None):
+         task_alert_email=None,
+         run_now=False,
+         wait=False,
+         timeout=3600):
     """
     Args:
         name (str):
@@ -831,6 +2831,12 @@ def task(name,
             Month	    1-12 or JAN-DEC
             Dayofweek	1-7 or SUN-SAT
             Year(optional)	empty, 1970-2099
+        run_now (bool):
+            Optional: Run the task immediately after scheduling it (default=False)
+        wait (bool):
+            Optional: Wait for the run started by run_now to finish (default=False)
+        timeout (int):
+            Optional: Seconds to wait for the task to finish (default=3600)
     Returns:
         str: metadata about task if successful
     """
@@ -849,11 +2855,205 @@ def task(name,
                    'task_alert_email': task_alert_email,
                    'cron': task_cron}
 
-    results = _script_processor(script_name, script_data, script_args, ret)
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Task {0} would be created or updated'.format(name)
+        if run_now:
+            ret['comment'] = 'Task {0} would be created or updated and run'.format(name)
+        return ret
 
-    return results
+    results = _script_json(script_name, script_data, script_args)
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if results['running']:
+        ret['result'] = False
+        ret['comment'] = 'Task {0} is currently running and could not be updated'.format(name)
+        return ret
+
+    ret['changes'] = {'nexus': results['task']}
+
+    if run_now:
+        run_ret = task_run(name, wait=wait, timeout=timeout)
+        ret['result'] = run_ret['result']
+        ret['comment'] = run_ret['comment']
+        ret['changes']['run'] = run_ret['changes']
+
+    return ret
+
+
+@_fan_out
+def task_run(name,
+             wait=True,
+             timeout=3600):
+    """
+    Run an existing Nexus 3 task immediately and optionally wait for it to finish.
+    If the task is already running, no new run is started and the current run is
+    waited for instead.
+
+    Args:
+        name (str):
+            Name of task
+        wait (bool):
+            Optional: Wait for the task to finish (default=True)
+        timeout (int):
+            Optional: Seconds to wait for the task to finish (default=3600)
+    Returns:
+        dict: outcome and duration (seconds) of the run if waited for
+    """
+    script_name = 'run_task'
+    script_data = nexus_groovy.run_task
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for task: {1}'.format(script_name, name)}
+
+    if __opts__['test']:
+        ret['result'] = None
+        ret['comment'] = 'Task {0} would be run'.format(name)
+        return ret
+
+    results = _script_json(script_name, script_data, {'name': name})
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
+
+    if not results['exists']:
+        ret['result'] = False
+        ret['comment'] = 'Task {0} does not exist'.format(name)
+        return ret
+
+    ret['changes'] = {'started': results['started']}
+    if not wait:
+        return ret
+
+    info = _wait_for_task(name, results['last_run_started'], timeout)
+    if info is None:
+        ret['result'] = False
+        ret['comment'] = 'Task {0} did not finish within {1} seconds'.format(name, timeout)
+        return ret
+
+    ret['changes']['outcome'] = info['last_run_result']
+    ret['changes']['duration'] = info['last_run_duration'] / 1000.0
+    if info['last_run_result'] != 'OK':
+        ret['result'] = False
+        ret['comment'] = 'Task {0} finished with outcome: {1}'.format(name, info['last_run_result'])
+    else:
+        ret['comment'] = 'Task {0} finished in {1} seconds'.format(name, ret['changes']['duration'])
+
+    return ret
+
+
+@_fan_out
+def task_schedule(name,
+                  tasks,
+                  window_start,
+                  window_end,
+                  schedule_days='* * ?',
+                  max_concurrent=1,
+                  default_duration=30,
+                  duration_margin=1.25):
+    """
+    Create or modify a set of scheduled tasks in Nexus 3 with start times spread
+    across a maintenance window instead of a shared cron expression
+
+    The duration of each task is taken from its last run in the Nexus task scheduler
+    (default_duration is used for tasks that have not run yet).  Tasks are placed so
+    that no more than max_concurrent run at once and tasks working on the same volume
+    never overlap.  The volume of a task is its blob store (directly or through its
+    repository) unless a volume key is given in the task definition.
+
+    Args:
+        name (str):
+            Name of the schedule.  Only used in the return message
+        tasks (dict):
+            Dictionary of task name to task definition.  A task definition takes the
+            same keys as nexus3.task (task_type_id, task_properties, task_alert_email)
+            and an optional volume.  task_cron is ignored
+        window_start (str):
+            Start of the maintenance window as HH:MM
+        window_end (str):
+            End of the maintenance window as HH:MM.  May be earlier than window_start
+            if the window spans midnight
+        schedule_days (str):
+            Optional: Day of month, month and day of week fields of the cron
+            expressions (default='* * ?')
+        max_concurrent (int):
+            Optional: Maximum number of tasks running at the same time, at least 1 (default=1)
+        default_duration (int):
+            Optional: Duration in minutes used for tasks without a previous run (default=30)
+        duration_margin (float):
+            Optional: Factor applied to the previous run duration (default=1.25)
+    Returns:
+        dict: cron expression and task metadata for each task
+    """
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': 'Tasks scheduled in window {0}-{1}: {2}'.format(window_start, window_end, name)}
+
+    if max_concurrent < 1:
+        ret['result'] = False
+        ret['comment'] = 'max_concurrent must be at least 1 for task schedule: {0}'.format(name)
+        return ret
+
+    existing_tasks = _script_json('get_tasks', nexus_groovy.get_tasks, {'names': list(tasks)})
+    if existing_tasks is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "get_tasks" failed to run.  See minion logs for details.'
+        return ret
+
+    durations = {}
+    volumes = {}
+    for task_name, definition in tasks.items():
+        existing = existing_tasks.get(task_name, {})
+        if existing.get('last_run_duration'):
+            durations[task_name] = int(existing['last_run_duration'] / 60000.0 * duration_margin) + 1
+        else:
+            durations[task_name] = default_duration
+        volumes[task_name] = definition.get('volume', existing.get('blob_store'))
+
+    window_start_minutes = _window_minutes(window_start)
+    window_length = (_window_minutes(window_end) - window_start_minutes) % (24 * 60)
+
+    offsets = _stagger_tasks(durations, volumes, window_length, max_concurrent)
+
+    for task_name, definition in tasks.items():
+        start = (window_start_minutes + offsets[task_name]) % (24 * 60)
+        task_cron = '0 {0} {1} {2}'.format(start % 60, start // 60, schedule_days)
+
+        if __opts__['test']:
+            old_cron = existing_tasks.get(task_name, {}).get('cron')
+            if old_cron != task_cron:
+                ret['changes'][task_name] = {'old': old_cron, 'new': task_cron}
+            continue
+
+        task_ret = task(task_name,
+                        definition['task_type_id'],
+                        definition.get('task_properties', {}),
+                        task_cron,
+                        task_alert_email=definition.get('task_alert_email'))
+        if not task_ret['result']:
+            ret['result'] = False
+            ret['comment'] = task_ret['comment']
+            return ret
+
+        ret['changes'][task_name] = {'cron': task_cron,
+                                     'nexus': task_ret['changes'].get('nexus')}
 
+    if __opts__['test'] and ret['changes']:
+        ret['result'] = None
+        ret['comment'] = 'Tasks would be rescheduled in window {0}-{1}: {2}'.format(window_start, window_end, name)
 
+    return ret
+
+
+@_fan_out
+@_cached('user:{name}')
 def user(name,
          first_name,
          last_name,
@@ -878,7 +3078,8 @@ def user(name,
         roles (list):
             List of user roles.  User roles need to exist or be create first
     Returns:
-        str: 'null' if successful
+        dict: action taken (created, updated) and the changed attributes
+              (details, roles, password).  Unchanged users report no changes
     """
     script_name = 'setup_user'
     script_data = nexus_groovy.setup_user
@@ -895,6 +3096,225 @@ def user(name,
                    'password': password,
                    'roles': roles}
 
-    results = _script_processor(script_name, script_data, script_args, ret)
+    results = _script_json(script_name, script_data, script_args)
+    if results is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "{0}" failed to run.  See minion logs for details.'.format(script_name)
+        return ret
 
-    return results
+    if results['action'] == 'unchanged':
+        ret['comment'] = 'User {0} is already up to date'.format(name)
+        return ret
+
+    ret['changes'] = {'action': results['action'],
+                      'changed': results['changed']}
+
+    return ret
+
+
+def _user_definitions(users, source):
+    """
+    Yields user definitions from a dictionary of username to user attributes
+    (the pillar format) and/or a local file.  Files are read one line at a time,
+    either CSV with a header row or JSON lines (one user object per line).
+    Roles in CSV files are separated by spaces
+    """
+    for username, definition in (users or {}).items():
+        definition = dict(definition)
+        definition['username'] = username
+        yield definition
+
+    if not source:
+        return
+
+    with open(source) as source_file:
+        if source.endswith('.csv'):
+            for row in csv.DictReader(source_file):
+                row['roles'] = (row.get('roles') or '').split()
+                yield row
+        else:
+            for line in source_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+@_fan_out
+def users(name,
+          users=None,
+          source=None,
+          update_passwords=False,
+          prune=False,
+          keep=('admin', 'anonymous'),
+          chunk_size=500):
+    """
+    Create, update or delete Nexus 3 users in bulk
+
+    The existing users are listed once and only users that need to be created,
+    updated or deleted are sent to Nexus, in chunks of chunk_size users per
+    script run.
+
+    Args:
+        name (str):
+            Name of the user set.  Only used in the return message
+        users (dict):
+            Optional: Dictionary of username to first_name, last_name, email,
+            password and roles (the same format as the nexus:users pillar)
+        source (str):
+            Optional: Local CSV (with a header row of username, first_name, last_name,
+            email, password, roles) or JSON lines file to read users from.
+            Roles in CSV files are separated by spaces
+        update_passwords (bool):
+            Optional: Check and update the passwords of existing users.  By default
+            passwords are only set when a user is created (default=False)
+        prune (bool):
+            Optional: Delete users that are not defined in users or source (default=False)
+        keep (list):
+            Optional: Users that are never deleted by prune (default=['admin', 'anonymous'])
+        chunk_size (int):
+            Optional: Number of users applied per script run (default=500)
+    Returns:
+        dict: lists of created, updated and deleted users
+    """
+    script_name = 'setup_user'
+    script_data = nexus_groovy.setup_user
+
+    ret = {'name': name,
+           'changes': {},
+           'result': True,
+           'comment': '"{0}" script run for users: {1}'.format(script_name, name)}
+
+    existing_users = _script_json('get_users', nexus_groovy.get_users, {})
+    if existing_users is None:
+        ret['result'] = False
+        ret['comment'] = 'Script: "get_users" failed to run.  See minion logs for details.'
+        return ret
+
+    defined = set()
+    missing_password = []
+
+    def _operations():
+        for definition in _user_definitions(users, source):
+            username = definition['username']
+            defined.add(username)
+            user_args = {'username': username,
+                         'first_name': definition.get('first_name'),
+                         'last_name': definition.get('last_name'),
+                         'email': definition.get('email'),
+                         'password': definition.get('password'),
+                         'roles': list(definition.get('roles') or [])}
+
+            existing = existing_users.get(username)
+            if existing is None:
+                if not user_args['password']:
+                    missing_password.append(username)
+                    continue
+                yield user_args
+                continue
+
+            if not update_passwords:
+                user_args['password'] = None
+                if (existing['first_name'] == user_args['first_name'] and
+                        existing['last_name'] == user_args['last_name'] and
+                        existing['email'] == user_args['email'] and
+                        set(existing['roles']) == set(user_args['roles'])):
+                    continue
+            yield user_args
+
+        if prune:
+            for username in existing_users:
+                if username not in defined and username not in keep:
+                    yield {'username': username, 'state': 'absent'}
+
+    changes = {'created': [], 'updated': [], 'deleted': []}
+
+    if __opts__['test']:
+        for operation in _operations():
+            if operation.get('state') == 'absent':
+                changes['deleted'].append(operation['username'])
+            elif operation['username'] in existing_users:
+                changes['updated'].append(operation['username'])
+            else:
+                changes['created'].append(operation['username'])
+        ret['changes'] = dict((action, names) for action, names in changes.items() if names)
+        ret['result'] = None
+        ret['comment'] = 'Users {0} would be changed'.format(name)
+    else:
+        for chunk in _chunks(_operations(), chunk_size):
+            results = _script_json(script_name, script_data, {'users': chunk})
+            if results is None:
+                # Earlier chunks stay applied, the users of the failed chunk may be partly applied
+                applied = sum(len(names) for names in changes.values())
+                ret['result'] = False
+                ret['comment'] = ('Script: "{0}" failed to run.  See minion logs for details.  '
+                                  '{1} users were applied before the failure (see changes), these users '
+                                  'may be partly applied: {2}'.format(script_name, applied,
+                                                                      ', '.join(user['username'] for user in chunk)))
+                break
+            for result in results:
+                if result['action'] != 'unchanged':
+                    changes[result['action']].append(result['username'])
+        ret['changes'] = dict((action, names) for action, names in changes.items() if names)
+
+    if missing_password:
+        ret['result'] = False
+        ret['comment'] = 'New users without a password were not created: {0}.  {1}'.format(
+            ', '.join(missing_password), ret['comment'])
+
+    return ret
+
+
+@_fan_out
+def webhook(name,
+            url,
+            secret,
+            repository=None,
+            events=None,
+            enabled=True):
+    """
+    Register a webhook with Nexus 3, i.e. the receiver of the nexus3_webhook engine.
+    Global webhooks report repository and audit events of the whole node,
+    repository webhooks report component and asset events of one repository
+
+    Args:
+        name (str):
+            Name of the webhook, stored as notes of the webhook capability
+        url (str):
+            URL the webhooks are posted to, i.e. http://salt-master:8765/nexus3
+        secret (str):
+            Secret used to sign the webhooks.  The nexus3_webhook engine drops
+            webhooks without a valid signature
+        repository (str):
+            Optional: Repository to report component and asset events for.
+            If not set, a global webhook is created (default=None)
+        events (list):
+            Optional: Events to report.  Options are repository and audit for global
+            webhooks (default=['repository', 'audit']) and component and asset for
+            repository webhooks (default=['component', 'asset'])
+        enabled (bool):
+            Optional: Enable or disable the webhook (default=True)
+    Returns:
+        dict: capability created or updated.  Unchanged webhooks report no changes
+    """
+    if repository is None:
+        type_id = 'webhook.global'
+        properties = {'names': ','.join(events or ['repository', 'audit'])}
+    else:
+        type_id = 'webhook.repository'
+        properties = {'repository': repository,
+                      'names': ','.join(events or ['component', 'asset'])}
+
+    if not secret:
+        return {'name': name,
+                'changes': {},
+                'result': False,
+                'comment': 'A secret is required for webhook: {0}, the nexus3_webhook engine '
+                           'drops unsigned webhooks'.format(name)}
+
+    properties['url'] = url
+    properties['secret'] = secret
+
+    ret = capability(name, properties=properties, enabled=enabled, notes=name, type_id=type_id)
+    if ret['result'] and not ret['changes']:
+        ret['comment'] = 'Webhook {0} is already up to date'.format(name)
+
+    return ret
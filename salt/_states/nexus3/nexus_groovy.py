@@ -9,7 +9,9 @@ import groovy.json.JsonSlurper
 
 parsed_args = new JsonSlurper().parseText(args)
 
-existingBlobStore = blobStore.getBlobStoreManager().get(parsed_args.name)
+blobStoreManager = blobStore.getBlobStoreManager()
+
+existingBlobStore = blobStoreManager.get(parsed_args.name)
 if (existingBlobStore == null) {
   if (parsed_args.type == "S3") {
       blobStore.createS3BlobStore(parsed_args.name, parsed_args.config)
@@ -24,9 +26,131 @@ if (existingBlobStore == null) {
 }
 
 log.info(msg, parsed_args.name)
+
+// Soft quota is only managed when a quota type was requested
+if (parsed_args.quota_type != null) {
+    config = blobStoreManager.get(parsed_args.name).getBlobStoreConfiguration()
+    quota = config.attributes('blobStoreQuotaConfig')
+    if (quota.get('quotaType') != parsed_args.quota_type ||
+            quota.get('quotaLimitBytes') as Long != parsed_args.quota_limit_bytes as Long) {
+        quota.set('quotaType', parsed_args.quota_type)
+        quota.set('quotaLimitBytes', parsed_args.quota_limit_bytes as Long)
+        blobStoreManager.update(config)
+        log.info("Blobstore {} soft quota set to {} {} bytes", parsed_args.name, parsed_args.quota_type, parsed_args.quota_limit_bytes)
+    }
+}
+"""
+
+create_blobstore_group = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import org.sonatype.nexus.blobstore.api.BlobStoreConfiguration
+
+parsed_args = new JsonSlurper().parseText(args)
+
+blobStoreManager = blobStore.getBlobStoreManager()
+
+existingBlobStore = blobStoreManager.get(parsed_args.name)
+if (existingBlobStore == null) {
+    config = blobStoreManager.respondsTo('newConfiguration') ? blobStoreManager.newConfiguration() : new BlobStoreConfiguration()
+    config.setName(parsed_args.name)
+    config.setType('Group')
+    config.attributes('group').set('members', parsed_args.members)
+    config.attributes('group').set('fillPolicy', parsed_args.fill_policy)
+    if (!parsed_args.dry_run) {
+        blobStoreManager.create(config)
+        log.info("Blobstore group {} created", parsed_args.name)
+    }
+    return JsonOutput.toJson([
+            old: [:],
+            new: [members: parsed_args.members, fill_policy: parsed_args.fill_policy]
+    ])
+}
+
+config = existingBlobStore.getBlobStoreConfiguration()
+if (config.getType() != 'Group') {
+    throw new IllegalStateException("Blobstore " + parsed_args.name + " already exists and is not a group")
+}
+
+group = config.attributes('group')
+existingMembers = group.get('members') as List
+existingFillPolicy = group.get('fillPolicy')
+
+if (existingMembers == parsed_args.members && existingFillPolicy == parsed_args.fill_policy) {
+    log.info("Blobstore group {} already up to date", parsed_args.name)
+    return JsonOutput.toJson([old: [:], new: [:]])
+}
+
+if (!parsed_args.dry_run) {
+    group.set('members', parsed_args.members)
+    group.set('fillPolicy', parsed_args.fill_policy)
+    blobStoreManager.update(config)
+    log.info("Blobstore group {} updated", parsed_args.name)
+}
+
+return JsonOutput.toJson([
+        old: [members: existingMembers, fill_policy: existingFillPolicy],
+        new: [members: parsed_args.members, fill_policy: parsed_args.fill_policy]
+])
+"""
+
+create_cleanup_policy = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import org.sonatype.nexus.cleanup.storage.CleanupPolicy
+import org.sonatype.nexus.cleanup.storage.CleanupPolicyStorage
+
+parsed_args = new JsonSlurper().parseText(args)
+
+CleanupPolicyStorage cleanupPolicyStorage = container.lookup(CleanupPolicyStorage.class.getName())
+
+// Ages are given in days and stored in seconds
+criteria = [:]
+if (parsed_args.last_blob_updated != null) {
+    criteria['lastBlobUpdated'] = String.valueOf((parsed_args.last_blob_updated as Long) * 86400)
+}
+if (parsed_args.last_downloaded != null) {
+    criteria['lastDownloaded'] = String.valueOf((parsed_args.last_downloaded as Long) * 86400)
+}
+if (parsed_args.prerelease != null) {
+    criteria['isPrerelease'] = String.valueOf(parsed_args.prerelease)
+}
+if (parsed_args.regex != null) {
+    criteria['regex'] = parsed_args.regex
+}
+criteria = criteria as Map<String, String>
+
+if (cleanupPolicyStorage.exists(parsed_args.name)) {
+    existingPolicy = cleanupPolicyStorage.get(parsed_args.name)
+    if (existingPolicy.getNotes() == parsed_args.notes &&
+            existingPolicy.getFormat() == parsed_args.format &&
+            existingPolicy.getCriteria() == criteria) {
+        log.info("Cleanup policy {} already up to date", parsed_args.name)
+        return JsonOutput.toJson([action: 'unchanged'])
+    }
+    existingPolicy.setNotes(parsed_args.notes)
+    existingPolicy.setFormat(parsed_args.format)
+    existingPolicy.setCriteria(criteria)
+    cleanupPolicyStorage.update(existingPolicy)
+    log.info("Cleanup policy {} updated", parsed_args.name)
+    return JsonOutput.toJson([action: 'updated', criteria: criteria])
+}
+
+CleanupPolicy cleanupPolicy = new CleanupPolicy(
+        name: parsed_args.name,
+        notes: parsed_args.notes,
+        format: parsed_args.format,
+        mode: 'delete',
+        criteria: criteria
+)
+cleanupPolicyStorage.add(cleanupPolicy)
+log.info("Cleanup policy {} created", parsed_args.name)
+
+return JsonOutput.toJson([action: 'created', criteria: criteria])
 """
 
 create_content_selector = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
 import org.sonatype.nexus.selector.SelectorManager
 import org.sonatype.nexus.selector.SelectorConfiguration
@@ -35,29 +159,51 @@ parsed_args = new JsonSlurper().parseText(args)
 
 selectorManager = container.lookup(SelectorManager.class.name)
 
-def selectorConfig
-boolean update = true
+// A list of selectors is applied as a batch in a single script run
+definitions = parsed_args.selectors != null ? parsed_args.selectors : [parsed_args]
 
-selectorConfig = selectorManager.browse().find { it -> it.name == parsed_args.name } 
+// Build the name lookup once instead of scanning every selector per definition
+existingSelectors = selectorManager.browse().collectEntries { [(it.name): it] }
 
-if (selectorConfig == null) {
-    update = false
-    selectorConfig = new SelectorConfiguration(
-        'name': parsed_args.name
-    )
-}
+results = [created: [], updated: []]
 
-selectorConfig.setDescription(parsed_args.description)
-selectorConfig.setType('csel')
-selectorConfig.setAttributes([
-    'expression': parsed_args.search_expression
-] as Map<String, Object>)
+definitions.each { definition ->
+    selectorConfig = existingSelectors[definition.name]
+    boolean update = selectorConfig != null
 
-if (update) {
-    selectorManager.update(selectorConfig)
-} else {
-    selectorManager.create(selectorConfig)
+    if (update &&
+            selectorConfig.getDescription() == definition.description &&
+            selectorConfig.getType() == 'csel' &&
+            selectorConfig.getAttributes()['expression'] == definition.search_expression) {
+        return
+    }
+
+    if (!update) {
+        selectorConfig = new SelectorConfiguration(
+            'name': definition.name
+        )
+    }
+
+    selectorConfig.setDescription(definition.description)
+    selectorConfig.setType('csel')
+    selectorConfig.setAttributes([
+        'expression': definition.search_expression
+    ] as Map<String, Object>)
+
+    if (update) {
+        if (!parsed_args.dry_run) {
+            selectorManager.update(selectorConfig)
+        }
+        results.updated << definition.name
+    } else {
+        if (!parsed_args.dry_run) {
+            selectorManager.create(selectorConfig)
+        }
+        results.created << definition.name
+    }
 }
+
+return JsonOutput.toJson(results)
 """
 
 create_repo_group = """
@@ -163,6 +309,10 @@ if (existingRepository != null) {
     newConfig.attributes['storage']['writePolicy'] = parsed_args.write_policy.toUpperCase()
     newConfig.attributes['storage']['strictContentTypeValidation'] = Boolean.valueOf(parsed_args.strict_content_validation)
 
+    if (parsed_args.cleanup_policies != null) {
+        newConfig.attributes['cleanup'] = [policyName: parsed_args.cleanup_policies.toSet()]
+    }
+
     repositoryManager.update(newConfig)
 
 } else {
@@ -234,6 +384,10 @@ if (existingRepository != null) {
         )
     }
 
+    if (parsed_args.cleanup_policies != null) {
+        configuration.attributes['cleanup'] = [policyName: parsed_args.cleanup_policies.toSet()]
+    }
+
     msg = "Configuration: {}"
     log.debug(msg, configuration)
 
@@ -285,6 +439,10 @@ if (existingRepository != null) {
     newConfig.attributes['storage']['strictContentTypeValidation'] = Boolean.valueOf(parsed_args.strict_content_validation)
     newConfig.attributes['httpclient']['authentication'] = authentication
 
+    if (parsed_args.cleanup_policies != null) {
+        newConfig.attributes['cleanup'] = [policyName: parsed_args.cleanup_policies.toSet()]
+    }
+
     repositoryManager.update(newConfig)
 
 } else {
@@ -411,6 +569,10 @@ if (existingRepository != null) {
         )
     }
 
+    if (parsed_args.cleanup_policies != null) {
+        configuration.attributes['cleanup'] = [policyName: parsed_args.cleanup_policies.toSet()]
+    }
+
     msg = "Configuration: {}"
     log.debug(msg, configuration)
 
@@ -420,6 +582,7 @@ if (existingRepository != null) {
 """
 
 create_task = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
 import org.sonatype.nexus.scheduling.TaskConfiguration
 import org.sonatype.nexus.scheduling.TaskInfo
@@ -436,7 +599,7 @@ TaskInfo existingTask = taskScheduler.listsTasks().find { TaskInfo taskInfo ->
 
 if (existingTask && existingTask.getCurrentState().getRunState() != null) {
     log.info("Could not update currently running task : " + parsed_args.name)
-    return
+    return JsonOutput.toJson([running: true, task: existingTask.toString()])
 }
 
 TaskConfiguration taskConfiguration = taskScheduler.createTaskConfigurationInstance(parsed_args.typeId)
@@ -453,26 +616,298 @@ parsed_args.booleanTaskProperties.each { key, value -> taskConfiguration.setBool
 
 Schedule schedule = taskScheduler.scheduleFactory.cron(new Date(), parsed_args.cron)
 
-taskScheduler.scheduleTask(taskConfiguration, schedule)
+TaskInfo scheduledTask = taskScheduler.scheduleTask(taskConfiguration, schedule)
+
+return JsonOutput.toJson([running: false, task: scheduledTask.toString()])
 """
 
 delete_blobstore = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
 
 parsed_args = new JsonSlurper().parseText(args)
 
-existingBlobStore = blobStore.getBlobStoreManager().get(parsed_args.name)
-if (existingBlobStore != null) {
-    blobStore.getBlobStoreManager().delete(parsed_args.name)
+blobStoreManager = blobStore.getBlobStoreManager()
+
+// A list of names is deleted as a batch in a single script run
+names = parsed_args.names != null ? parsed_args.names : [parsed_args.name]
+
+deleted = []
+names.each { name ->
+    existingBlobStore = blobStoreManager.get(name)
+    if (existingBlobStore != null) {
+        blobStoreManager.delete(name)
+        deleted << name
+        log.info("Blobstore {} deleted", name)
+    }
 }
+
+return JsonOutput.toJson(deleted)
 """
 
 delete_repo = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+
+parsed_args = new JsonSlurper().parseText(args)
+
+repositoryManager = repository.getRepositoryManager()
+
+// A list of names is deleted as a batch in a single script run
+names = parsed_args.names != null ? parsed_args.names : [parsed_args.name]
+
+deleted = []
+names.each { name ->
+    if (repositoryManager.get(name) != null) {
+        repositoryManager.delete(name)
+        deleted << name
+        log.info("Repo {} deleted", name)
+    }
+}
+
+return JsonOutput.toJson(deleted)
+"""
+
+get_blobstore_metrics = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+
+parsed_args = new JsonSlurper().parseText(args)
+
+blobStoreManager = blobStore.getBlobStoreManager()
+
+existingRepository = parsed_args.repository == null ? null : repository.repositoryManager.get(parsed_args.repository)
+
+blobStores = [:]
+blobStoreManager.browse().each { store ->
+    config = store.getBlobStoreConfiguration()
+    if (parsed_args.names == null || parsed_args.names.contains(config.getName())) {
+        metrics = store.getMetrics()
+        quota = config.getAttributes().get('blobStoreQuotaConfig')
+        blobStores[config.getName()] = [
+                type: config.getType(),
+                total_size: metrics.getTotalSize(),
+                available_space: metrics.getAvailableSpace(),
+                blob_count: metrics.getBlobCount(),
+                unlimited: metrics.isUnlimited(),
+                quota_type: quota == null ? null : quota.get('quotaType'),
+                quota_limit_bytes: quota == null ? null : quota.get('quotaLimitBytes'),
+                members: config.getAttributes().get('group')?.get('members')
+        ]
+    }
+}
+
+return JsonOutput.toJson([
+        repository_blob_store: existingRepository == null ? null : existingRepository.configuration.attributes['storage']['blobStoreName'],
+        blob_stores: blobStores
+])
+"""
+
+get_fingerprints = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import java.security.MessageDigest
+import org.sonatype.nexus.cleanup.storage.CleanupPolicyStorage
+import org.sonatype.nexus.email.EmailManager
+import org.sonatype.nexus.httpclient.HttpClientManager
+import org.sonatype.nexus.internal.capability.DefaultCapabilityRegistry
+import org.sonatype.nexus.ldap.persist.LdapConfigurationManager
+import org.sonatype.nexus.scheduling.TaskScheduler
+import org.sonatype.nexus.security.anonymous.AnonymousManager
+import org.sonatype.nexus.security.realm.RealmManager
+import org.sonatype.nexus.security.user.UserManager
+import org.sonatype.nexus.security.user.UserSearchCriteria
+
+parsed_args = new JsonSlurper().parseText(args)
+
+fingerprints = [:]
+
+// Only the requested keys are returned, or every key if none are requested
+def add(String key, Closure value) {
+    if (parsed_args.keys == null || parsed_args.keys.contains(key)) {
+        fingerprints[key] = MessageDigest.getInstance('SHA-1')
+                .digest(value.call().toString().getBytes('UTF-8')).encodeHex().toString()
+    }
+}
+
+def beanMap(bean) {
+    return bean == null ? null : bean.properties.findAll { it.key != 'class' }.sort()
+}
+
+repository.repositoryManager.browse().each { existingRepository ->
+    add('repository:' + existingRepository.name) {
+        [existingRepository.configuration.online, existingRepository.configuration.attributes]
+    }
+}
+
+blobStore.blobStoreManager.browse().each { store ->
+    config = store.blobStoreConfiguration
+    add('blobstore:' + config.name) { [config.type, config.attributes] }
+}
+
+authManager = security.securitySystem.getAuthorizationManager(UserManager.DEFAULT_SOURCE)
+authManager.listRoles().each { role ->
+    add('role:' + role.roleId) { [role.name, role.description, role.privileges.sort(), role.roles.sort()] }
+}
+
+security.securitySystem.searchUsers(new UserSearchCriteria(source: UserManager.DEFAULT_SOURCE)).each { user ->
+    add('user:' + user.userId) {
+        [user.firstName, user.lastName, user.emailAddress, user.status,
+         user.roles.findAll { it.source == UserManager.DEFAULT_SOURCE }.collect { it.roleId }.sort()]
+    }
+}
+
+container.lookup(TaskScheduler.class.getName()).listsTasks().each { taskInfo ->
+    add('task:' + taskInfo.name) {
+        [taskInfo.configuration.asMap().findAll { !it.key.startsWith('.lastRunState') && it.key != '.updated' }.sort(),
+         taskInfo.schedule.type,
+         taskInfo.schedule.respondsTo('getCronExpression') ? taskInfo.schedule.cronExpression : null]
+    }
+}
+
+container.lookup(CleanupPolicyStorage.class.getName()).getAll().each { policy ->
+    add('cleanup_policy:' + policy.name) { [policy.notes, policy.format, policy.criteria.sort()] }
+}
+
+container.lookup(DefaultCapabilityRegistry.class.getName()).all.each { capabilityReference ->
+    context = capabilityReference.context()
+    add('capability:' + context.descriptor().type().toString()) { [context.isEnabled(), context.properties().sort()] }
+}
+
+container.lookup(LdapConfigurationManager.class.getName()).listLdapServerConfigurations().each { ldapConfig ->
+    add('ldap:' + ldapConfig.name) {
+        [ldapConfig.order, beanMap(ldapConfig.connection), beanMap(ldapConfig.mapping)]
+    }
+}
+
+add('realms') { container.lookup(RealmManager.class.getName()).getConfiguration().getRealmNames() }
+
+add('anonymous_access') { container.lookup(AnonymousManager.class.getName()).getConfiguration().isEnabled() }
+
+add('email') { beanMap(container.lookup(EmailManager.class.getName()).getConfiguration()) }
+
+add('http_proxy') {
+    proxy = container.lookup(HttpClientManager.class.getName()).getConfiguration().getProxy()
+    [beanMap(proxy?.http), beanMap(proxy?.https), proxy?.nonProxyHosts]
+}
+
+return JsonOutput.toJson(fingerprints)
+"""
+
+get_repositories = """
+import groovy.json.JsonOutput
+
+repositories = [:]
+repository.repositoryManager.browse().each { existingRepository ->
+    config = existingRepository.configuration
+    repositories[config.repositoryName] = [
+            recipe_name: config.recipeName,
+            online: config.online,
+            blob_store: config.attributes['storage']?.get('blobStoreName')
+    ]
+}
+
+return JsonOutput.toJson(repositories)
+"""
+
+get_tasks = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
+import org.sonatype.nexus.scheduling.TaskInfo
+import org.sonatype.nexus.scheduling.TaskScheduler
+import org.sonatype.nexus.scheduling.schedule.Cron
 
 parsed_args = new JsonSlurper().parseText(args)
 
-repository.getRepositoryManager().delete(parsed_args.name)
+TaskScheduler taskScheduler = container.lookup(TaskScheduler.class.getName())
+
+repositoryManager = repository.repositoryManager
+
+tasks = [:]
+taskScheduler.listsTasks().each { TaskInfo taskInfo ->
+    if (parsed_args.names == null || parsed_args.names.contains(taskInfo.name)) {
+        config = taskInfo.getConfiguration()
+        lastRun = taskInfo.getLastRunState()
+        schedule = taskInfo.getSchedule()
+
+        // Resolve the blob store the task works on, directly or through its repository
+        blobStoreName = config.getString('blobstoreName')
+        repositoryName = config.getString('repositoryName')
+        if (blobStoreName == null && repositoryName != null) {
+            existingRepository = repositoryManager.get(repositoryName)
+            if (existingRepository != null) {
+                blobStoreName = existingRepository.configuration.attributes['storage']['blobStoreName']
+            }
+        }
+
+        tasks[taskInfo.name] = [
+                id: taskInfo.getId(),
+                type_id: taskInfo.getTypeId(),
+                state: taskInfo.getCurrentState().getState().toString(),
+                run_state: taskInfo.getCurrentState().getRunState()?.toString(),
+                last_run_started: lastRun?.getRunStarted()?.getTime(),
+                last_run_duration: lastRun?.getRunDuration(),
+                last_run_result: lastRun?.getEndState()?.toString(),
+                cron: schedule instanceof Cron ? schedule.getCronExpression() : null,
+                blob_store: blobStoreName
+        ]
+    }
+}
+
+return JsonOutput.toJson(tasks)
+"""
+
+get_users = """
+import groovy.json.JsonOutput
+import org.sonatype.nexus.security.user.UserManager
+import org.sonatype.nexus.security.user.UserSearchCriteria
+
+users = security.securitySystem.searchUsers(new UserSearchCriteria(source: UserManager.DEFAULT_SOURCE))
+
+return JsonOutput.toJson(users.collectEntries { user ->
+    [(user.userId): [
+            first_name: user.firstName,
+            last_name: user.lastName,
+            email: user.emailAddress,
+            roles: user.roles.findAll { it.source == UserManager.DEFAULT_SOURCE }.collect { it.roleId }
+    ]]
+})
+"""
+
+run_task = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import org.sonatype.nexus.scheduling.TaskInfo
+import org.sonatype.nexus.scheduling.TaskScheduler
+
+parsed_args = new JsonSlurper().parseText(args)
+
+TaskScheduler taskScheduler = container.lookup(TaskScheduler.class.getName())
+
+TaskInfo existingTask = taskScheduler.listsTasks().find { TaskInfo taskInfo ->
+    taskInfo.name == parsed_args.name
+}
+
+if (existingTask == null) {
+    log.info("Could not run missing task : " + parsed_args.name)
+    return JsonOutput.toJson([exists: false])
+}
+
+lastRunStarted = existingTask.getLastRunState()?.getRunStarted()?.getTime()
+running = existingTask.getCurrentState().getRunState() != null
+
+// A task that is already running is not started again, callers wait for the current run
+if (!running) {
+    existingTask.runNow()
+    log.info("Started task {}", parsed_args.name)
+}
+
+return JsonOutput.toJson([
+        exists: true,
+        id: existingTask.getId(),
+        started: !running,
+        last_run_started: lastRunStarted
+])
 """
 
 setup_anonymous_access = """
@@ -492,34 +927,65 @@ core.baseUrl(parsed_args.base_url)
 """
 
 setup_capability = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
 import org.sonatype.nexus.capability.CapabilityReference
 import org.sonatype.nexus.capability.CapabilityType
-import org.sonatype.nexus.internal.capability.DefaultCapabilityReference
 import org.sonatype.nexus.internal.capability.DefaultCapabilityRegistry
 
 parsed_args = new JsonSlurper().parseText(args)
 
-parsed_args.capability_properties['headerEnabled'] = parsed_args.capability_properties['headerEnabled'].toString()
-parsed_args.capability_properties['footerEnabled'] = parsed_args.capability_properties['footerEnabled'].toString()
-
 def capabilityRegistry = container.lookup(DefaultCapabilityRegistry.class.getName())
-def capabilityType = CapabilityType.capabilityType(parsed_args.capability_typeId)
 
-DefaultCapabilityReference existing = capabilityRegistry.all.find { CapabilityReference capabilityReference ->
-    capabilityReference.context().descriptor().type() == capabilityType
-}
+// A list of capabilities is applied as a batch in a single script run
+definitions = parsed_args.capabilities != null ? parsed_args.capabilities : [parsed_args]
 
-if (existing) {
-    log.info(parsed_args.typeId + ' capability updated to: {}',
-            capabilityRegistry.update(existing.id(), Boolean.valueOf(parsed_args.get('capability_enabled', true)), existing.notes(), parsed_args.capability_properties).toString()
-    )
+// Index the registry by type once instead of scanning it for every capability
+existingCapabilities = capabilityRegistry.all.groupBy { CapabilityReference capabilityReference ->
+    capabilityReference.context().descriptor().type().toString()
 }
-else {
-    log.info(parsed_args.typeId + ' capability created as: {}', capabilityRegistry.
-            add(capabilityType, Boolean.valueOf(parsed_args.get('capability_enabled', true)), 'configured through api', parsed_args.capability_properties).toString()
-    )
+
+results = [created: [], updated: []]
+
+definitions.each { definition ->
+    capabilityType = CapabilityType.capabilityType(definition.capability_typeId)
+    enabled = Boolean.valueOf(definition.get('capability_enabled', true))
+    // Capability properties are always stored as strings, null keeps the existing properties
+    properties = definition.capability_properties == null ? null :
+            definition.capability_properties.collectEntries { key, value -> [(key): value.toString()] }
+    label = definition.notes == null ? definition.capability_typeId : definition.capability_typeId + ' (' + definition.notes + ')'
+
+    existing = (existingCapabilities[capabilityType.toString()] ?: []).find { CapabilityReference capabilityReference ->
+        definition.notes == null || capabilityReference.context().notes() == definition.notes
+    }
+
+    if (existing) {
+        // Only the given properties are compared and changed, the others are kept
+        existingProperties = existing.context().properties()
+        mergedProperties = new HashMap(existingProperties)
+        if (properties != null) {
+            mergedProperties.putAll(properties)
+        }
+        if (existing.context().isEnabled() != enabled || existingProperties != mergedProperties) {
+            if (!parsed_args.dry_run) {
+                log.info(label + ' capability updated to: {}',
+                        capabilityRegistry.update(existing.context().id(), enabled, existing.context().notes(), mergedProperties).toString()
+                )
+            }
+            results.updated << label
+        }
+    }
+    else {
+        if (!parsed_args.dry_run) {
+            log.info(label + ' capability created as: {}', capabilityRegistry.
+                    add(capabilityType, enabled, definition.notes ?: 'configured through api', properties ?: [:]).toString()
+            )
+        }
+        results.created << label
+    }
 }
+
+return JsonOutput.toJson(results)
 """
 
 setup_email = """
@@ -550,33 +1016,87 @@ emailMgr.configuration = emailConfig
 """
 
 setup_http_proxy = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
+import org.sonatype.nexus.httpclient.HttpClientManager
 
 parsed_args = new JsonSlurper().parseText(args)
 
+httpClientManager = container.lookup(HttpClientManager.class.getName())
+proxy = httpClientManager.getConfiguration().getProxy()
 
-core.removeHTTPProxy()
-if (parsed_args.with_http_proxy) {
-    if (parsed_args.http_proxy_username) {
-        core.httpProxyWithBasicAuth(parsed_args.http_proxy_host, parsed_args.http_proxy_port as int, parsed_args.http_proxy_username, parsed_args.http_proxy_password)
-    } else {
-        core.httpProxy(parsed_args.http_proxy_host, parsed_args.http_proxy_port as int)
+def serverConfig(server) {
+    if (server == null || !server.enabled) {
+        return [enabled: false]
     }
+    def auth = server.authentication
+    return [enabled: true, host: server.host, port: server.port,
+            username: auth?.username, password: auth?.password?.toString()]
 }
 
-core.removeHTTPSProxy()
-if (parsed_args.with_https_proxy) {
-    if (parsed_args.https_proxy_username) {
-        core.httpsProxyWithBasicAuth(parsed_args.https_proxy_host, parsed_args.https_proxy_port as int, parsed_args.https_proxy_username, parsed_args.https_proxy_password)
-    } else {
-        core.httpsProxy(parsed_args.https_proxy_host, parsed_args.https_proxy_port as int)
+def desiredServerConfig(enabled, host, port, username, password) {
+    if (!enabled) {
+        return [enabled: false]
+    }
+    return [enabled: true, host: host, port: port as int,
+            username: username ?: null, password: username ? password : null]
+}
+
+current = [
+        http: serverConfig(proxy?.http),
+        https: serverConfig(proxy?.https),
+        non_proxy_hosts: (proxy?.nonProxyHosts ?: []) as List
+]
+
+desired = [
+        http: desiredServerConfig(parsed_args.with_http_proxy, parsed_args.http_proxy_host, parsed_args.http_proxy_port,
+                parsed_args.http_proxy_username, parsed_args.http_proxy_password),
+        https: desiredServerConfig(parsed_args.with_https_proxy, parsed_args.https_proxy_host, parsed_args.https_proxy_port,
+                parsed_args.https_proxy_username, parsed_args.https_proxy_password),
+        non_proxy_hosts: (parsed_args.with_http_proxy || parsed_args.with_https_proxy) ? (parsed_args.proxy_exclude_hosts ?: []) : []
+]
+
+changed = desired.keySet().findAll { desired[it] != current[it] }
+
+// Proxies are set in place instead of being removed and added again,
+// so the proxy configuration never disappears while it is being changed.
+// Removing the http proxy also removes the https proxy, which then has to be set again
+if (!parsed_args.dry_run) {
+    httpRemoved = changed.contains('http') && !parsed_args.with_http_proxy && current.http.enabled
+    if (changed.contains('http')) {
+        if (parsed_args.with_http_proxy) {
+            if (parsed_args.http_proxy_username) {
+                core.httpProxyWithBasicAuth(parsed_args.http_proxy_host, parsed_args.http_proxy_port as int, parsed_args.http_proxy_username, parsed_args.http_proxy_password)
+            } else {
+                core.httpProxy(parsed_args.http_proxy_host, parsed_args.http_proxy_port as int)
+            }
+        } else if (httpRemoved) {
+            core.removeHTTPProxy()
+        }
+    }
+
+    if (changed.contains('https') || httpRemoved) {
+        if (parsed_args.with_https_proxy) {
+            if (parsed_args.https_proxy_username) {
+                core.httpsProxyWithBasicAuth(parsed_args.https_proxy_host, parsed_args.https_proxy_port as int, parsed_args.https_proxy_username, parsed_args.https_proxy_password)
+            } else {
+                core.httpsProxy(parsed_args.https_proxy_host, parsed_args.https_proxy_port as int)
+            }
+        } else if (changed.contains('https') && current.https.enabled) {
+            core.removeHTTPSProxy()
+        }
+    }
+
+    if ((changed.contains('non_proxy_hosts') || httpRemoved) && (parsed_args.with_http_proxy || parsed_args.with_https_proxy)) {
+        core.nonProxyHosts(desired.non_proxy_hosts as String[])
     }
 }
 
-if (parsed_args.with_http_proxy || parsed_args.with_https_proxy) {
-    core.nonProxyHosts()
-    core.nonProxyHosts(parsed_args.proxy_exclude_hosts as String[])
+def masked(config) {
+    return config.collectEntries { key, value -> [(key): value instanceof Map && value.password ? value + [password: '********'] : value] }
 }
+
+return JsonOutput.toJson([old: masked(current.subMap(changed)), new: masked(desired.subMap(changed))])
 """
 
 setup_ldap = """
@@ -615,9 +1135,15 @@ if (parsed_args.auth == "simple") {
     connection.setAuthScheme("none")
 }
 connection.setSearchBase(parsed_args.search_base)
-connection.setConnectionTimeout(30)
-connection.setConnectionRetryDelay(300)
-connection.setMaxIncidentsCount(3)
+connection.setConnectionTimeout(Integer.valueOf(parsed_args.get('connection_timeout', 30)))
+connection.setConnectionRetryDelay(Integer.valueOf(parsed_args.get('connection_retry_delay', 300)))
+connection.setMaxIncidentsCount(Integer.valueOf(parsed_args.get('max_incidents_count', 3)))
+if (parsed_args.backup_hostname) {
+    connection.setBackupHost(new Connection.Host(Connection.Protocol.valueOf(parsed_args.backup_protocol), parsed_args.backup_hostname, Integer.valueOf(parsed_args.backup_port)))
+}
+if (parsed_args.use_trust_store != null) {
+    connection.setUseTrustStore(Boolean.valueOf(parsed_args.use_trust_store))
+}
 ldapConfig.setConnection(connection)
 
 
@@ -655,11 +1181,69 @@ if (update) {
 } else {
     ldapConfigMgr.addLdapServerConfiguration(ldapConfig)
 }
+
+// Servers are consulted in order, so the closest server should come first
+if (parsed_args.order != null) {
+    serverIds = ldapConfigMgr.listLdapServerConfigurations().sort { it.order }.collect { it.id }
+    serverId = ldapConfigMgr.listLdapServerConfigurations().find { it.name == parsed_args.name }.id
+    position = Math.max(0, Math.min(Integer.valueOf(parsed_args.order), serverIds.size() - 1))
+    if (serverIds.indexOf(serverId) != position) {
+        serverIds.remove(serverId)
+        serverIds.add(position, serverId)
+        ldapConfigMgr.setServerOrder(serverIds)
+    }
+}
+"""
+
+setup_lease = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+
+parsed_args = new JsonSlurper().parseText(args)
+
+// Leases live in the JVM system properties, so they are shared by all script
+// runs on the node and forgotten when Nexus restarts
+def leaseKey = 'salt.nexus3.lease.' + parsed_args.name
+def appliedKey = 'salt.nexus3.applied.' + parsed_args.name
+def properties = System.getProperties()
+def now = System.currentTimeMillis()
+
+synchronized (properties) {
+    def lease = properties.getProperty(leaseKey) ? new JsonSlurper().parseText(properties.getProperty(leaseKey)) : null
+    if (lease != null && lease.expires < now) {
+        lease = null
+    }
+    def applied = properties.getProperty(appliedKey)
+
+    if (parsed_args.action == 'release') {
+        if (lease != null && lease.owner == parsed_args.owner) {
+            properties.remove(leaseKey)
+            if (parsed_args.version != null) {
+                properties.setProperty(appliedKey, parsed_args.version)
+            }
+            return JsonOutput.toJson([status: 'released', owner: parsed_args.owner, version: parsed_args.version])
+        }
+        return JsonOutput.toJson([status: 'not_held', owner: lease?.owner, version: applied])
+    }
+
+    if (lease != null && lease.owner != parsed_args.owner) {
+        return JsonOutput.toJson([status: 'held', owner: lease.owner, version: lease.version,
+                                  expires_in: (lease.expires - now) / 1000])
+    }
+    if (parsed_args.version != null && applied == parsed_args.version) {
+        return JsonOutput.toJson([status: 'applied', owner: null, version: applied])
+    }
+
+    properties.setProperty(leaseKey, JsonOutput.toJson([owner: parsed_args.owner,
+                                                        version: parsed_args.version,
+                                                        expires: now + parsed_args.ttl * 1000]))
+    return JsonOutput.toJson([status: 'acquired', owner: parsed_args.owner, version: parsed_args.version])
+}
 """
 
 setup_privilege = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
-import org.sonatype.nexus.security.privilege.NoSuchPrivilegeException
 import org.sonatype.nexus.security.user.UserManager
 import org.sonatype.nexus.security.privilege.Privilege
 
@@ -667,36 +1251,93 @@ parsed_args = new JsonSlurper().parseText(args)
 
 authManager = security.getSecuritySystem().getAuthorizationManager(UserManager.DEFAULT_SOURCE)
 
-def privilege
-boolean update = true
-
-try {
-    privilege = authManager.getPrivilege(parsed_args.name)
-} catch (NoSuchPrivilegeException ignored) {
-    // could not find any existing  privilege
-    update = false
-    privilege = new Privilege(
-            'id': parsed_args.name,
-            'name': parsed_args.name
-    )
-}
-
-privilege.setDescription(parsed_args.description)
-privilege.setType(parsed_args.type)
-privilege.setProperties([
-        'format': parsed_args.format,
-        'contentSelector': parsed_args.contentSelector,
-        'repository': parsed_args.repository,
-        'actions': parsed_args.actions.join(',')
-] as Map<String, String>)
+// A list of privileges is applied as a batch in a single script run
+definitions = parsed_args.privileges != null ? parsed_args.privileges : [parsed_args]
 
-if (update) {
-    authManager.updatePrivilege(privilege)
-    log.info("Privilege {} updated", parsed_args.name)
-} else {
-    authManager.addPrivilege(privilege)
-    log.info("Privilege {} created", parsed_args.name)
+// One listing instead of a getPrivilege lookup per privilege
+existingPrivileges = authManager.listPrivileges().collectEntries { [(it.id): it] }
+
+results = [created: [], updated: []]
+
+definitions.each { definition ->
+    properties = privilegeProperties(definition)
+    existing = existingPrivileges[definition.name]
+
+    if (existing == null) {
+        privilege = new Privilege(
+                'id': definition.name,
+                'name': definition.name
+        )
+        privilege.setDescription(definition.description)
+        privilege.setType(definition.type)
+        privilege.setProperties(properties)
+        if (!parsed_args.dry_run) {
+            authManager.addPrivilege(privilege)
+            log.info("Privilege {} created", definition.name)
+        }
+        results.created << definition.name
+    } else if (existing.getDescription() != definition.description ||
+            existing.getType() != definition.type ||
+            existing.getProperties() != properties) {
+        // Unchanged privileges are skipped so the security caches are left alone
+        if (!parsed_args.dry_run) {
+            existing.setDescription(definition.description)
+            existing.setType(definition.type)
+            existing.setProperties(properties)
+            authManager.updatePrivilege(existing)
+            log.info("Privilege {} updated", definition.name)
+        }
+        results.updated << definition.name
+    }
+}
+
+return JsonOutput.toJson(results)
+
+def privilegeProperties(definition) {
+    if (definition.properties != null) {
+        return definition.properties.collectEntries { key, value ->
+            [(key): value instanceof List ? value.join(',') : value.toString()]
+        } as Map<String, String>
+    }
+
+    def properties = [:]
+    ['format', 'contentSelector', 'repository', 'pattern', 'domain'].each { key ->
+        if (definition[key] != null) {
+            properties[key] = definition[key].toString()
+        }
+    }
+    if (definition.actions != null) {
+        properties['actions'] = definition.actions.join(',')
+    }
+    return properties as Map<String, String>
+}
+"""
+
+setup_realm_order = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import org.sonatype.nexus.security.realm.RealmManager
+
+parsed_args = new JsonSlurper().parseText(args)
+
+realmManager = container.lookup(RealmManager.class.getName())
+
+realmConfig = realmManager.getConfiguration()
+existingRealms = realmConfig.getRealmNames().collect()
+
+if (existingRealms == parsed_args.realms) {
+    log.info("Realm order already up to date: {}", existingRealms)
+    return JsonOutput.toJson([old: [], new: []])
+}
+
+// The whole chain is replaced at once so the order does not depend on state ordering
+if (!parsed_args.dry_run) {
+    realmConfig.setRealmNames(parsed_args.realms)
+    realmManager.setConfiguration(realmConfig)
+    log.info("Realm order changed from {} to {}", existingRealms, parsed_args.realms)
 }
+
+return JsonOutput.toJson([old: existingRealms, new: parsed_args.realms])
 """
 
 setup_realms = """
@@ -734,72 +1375,153 @@ if (parsed_args.realm_name == 'DockerToken') {
 """
 
 setup_role = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
 import org.sonatype.nexus.security.user.UserManager
-import org.sonatype.nexus.security.role.NoSuchRoleException
 
 parsed_args = new JsonSlurper().parseText(args)
 
 authManager = security.getSecuritySystem().getAuthorizationManager(UserManager.DEFAULT_SOURCE)
 
-privileges = (parsed_args.privileges == null ? new HashSet() : parsed_args.privileges.toSet())
-roles = (parsed_args.roles == null ? new HashSet() : parsed_args.roles.toSet())
-
-try {
-    existingRole = authManager.getRole(parsed_args.id)
-    existingRole.setName(parsed_args.name)
-    existingRole.setDescription(parsed_args.description)
-    existingRole.setPrivileges(privileges)
-    existingRole.setRoles(roles)
-    authManager.updateRole(existingRole)
-    log.info("Role {} updated", parsed_args.name)
-} catch (NoSuchRoleException ignored) {
-    security.addRole(parsed_args.id, parsed_args.name, parsed_args.description, privileges.toList(), roles.toList())
-    log.info("Role {} created", parsed_args.name)
+// A list of roles is applied as a batch in a single script run
+definitions = parsed_args.role_definitions != null ? parsed_args.role_definitions : [parsed_args]
+
+existingRoles = authManager.listRoles().collectEntries { [(it.roleId): it] }
+
+results = [:]
+
+definitions.each { definition ->
+    privileges = (definition.privileges == null ? new HashSet() : definition.privileges.toSet())
+    roles = (definition.roles == null ? new HashSet() : definition.roles.toSet())
+
+    desired = [name: definition.name, description: definition.description, privileges: privileges, roles: roles]
+    existingRole = existingRoles[definition.id]
+
+    if (existingRole == null) {
+        if (!parsed_args.dry_run) {
+            security.addRole(definition.id, definition.name, definition.description, privileges.toList(), roles.toList())
+            log.info("Role {} created", definition.name)
+        }
+        results[definition.id] = [action: 'created', old: [:], new: jsonRole(desired)]
+        return
+    }
+
+    current = [name: existingRole.name, description: existingRole.description,
+               privileges: existingRole.privileges.toSet(), roles: existingRole.roles.toSet()]
+    changedKeys = desired.keySet().findAll { desired[it] != current[it] }
+
+    // Every role write flushes the authorization caches, so unchanged roles are left alone
+    if (changedKeys) {
+        if (!parsed_args.dry_run) {
+            existingRole.setName(definition.name)
+            existingRole.setDescription(definition.description)
+            existingRole.setPrivileges(privileges)
+            existingRole.setRoles(roles)
+            authManager.updateRole(existingRole)
+            log.info("Role {} updated", definition.name)
+        }
+        results[definition.id] = [action: 'updated',
+                                  old: jsonRole(current.subMap(changedKeys)),
+                                  new: jsonRole(desired.subMap(changedKeys))]
+    }
+}
+
+return JsonOutput.toJson(results)
+
+def jsonRole(role) {
+    return role.collectEntries { key, value -> [(key): value instanceof Set ? value.sort() : value] }
 }
 """
 
 setup_user = """
+import groovy.json.JsonOutput
 import groovy.json.JsonSlurper
+import org.apache.shiro.authc.AuthenticationException
+import org.apache.shiro.authc.UsernamePasswordToken
 import org.sonatype.nexus.security.user.UserManager
 import org.sonatype.nexus.security.user.UserNotFoundException
 import org.sonatype.nexus.security.user.User
 
 parsed_args = new JsonSlurper().parseText(args)
-state = parsed_args.state == null ? 'present' : parsed_args.state
 
-if ( state == 'absent' ) {
-    deleteUser(parsed_args)
-} else {
+// A list of users is applied as a batch in a single script run
+if (parsed_args.users != null) {
+    return JsonOutput.toJson(parsed_args.users.collect { applyUser(it) })
+}
+
+return JsonOutput.toJson(applyUser(parsed_args))
+
+def applyUser(parsed_args) {
+    def state = parsed_args.state == null ? 'present' : parsed_args.state
+
+    if ( state == 'absent' ) {
+        return deleteUser(parsed_args)
+    } else {
+        try {
+            return updateUser(parsed_args)
+        } catch (UserNotFoundException ignored) {
+            return addUser(parsed_args)
+        }
+    }
+}
+
+def passwordMatches(parsed_args) {
+    // Checking the password is far cheaper than changing it, which rehashes
+    // the password and invalidates the sessions and cached credentials of the user
     try {
-        updateUser(parsed_args)
-    } catch (UserNotFoundException ignored) {
-        addUser(parsed_args)
+        security.securitySystem.authenticate(new UsernamePasswordToken(parsed_args.username, parsed_args.password as String))
+        return true
+    } catch (AuthenticationException ignored) {
+        return false
     }
 }
 
 def updateUser(parsed_args) {
     User user = security.securitySystem.getUser(parsed_args.username)
-    user.setFirstName(parsed_args.first_name)
-    user.setLastName(parsed_args.last_name)
-    user.setEmailAddress(parsed_args.email)
-    security.securitySystem.updateUser(user)
-    security.setUserRoles(parsed_args.username, parsed_args.roles)
-    security.securitySystem.changePassword(parsed_args.username, parsed_args.password)
-    log.info("Updated user {}", parsed_args.username)
+    def changed = []
+
+    if (user.getFirstName() != parsed_args.first_name ||
+            user.getLastName() != parsed_args.last_name ||
+            user.getEmailAddress() != parsed_args.email) {
+        user.setFirstName(parsed_args.first_name)
+        user.setLastName(parsed_args.last_name)
+        user.setEmailAddress(parsed_args.email)
+        security.securitySystem.updateUser(user)
+        changed << 'details'
+    }
+
+    def existingRoles = user.getRoles().findAll { it.source == UserManager.DEFAULT_SOURCE }.collect { it.roleId } as Set
+    if (existingRoles != (parsed_args.roles as Set)) {
+        security.setUserRoles(parsed_args.username, parsed_args.roles)
+        changed << 'roles'
+    }
+
+    // The password is not checked when it is not given (bulk updates)
+    if (parsed_args.password != null && !passwordMatches(parsed_args)) {
+        security.securitySystem.changePassword(parsed_args.username, parsed_args.password)
+        changed << 'password'
+    }
+
+    if (changed) {
+        log.info("Updated user {}: {}", parsed_args.username, changed)
+    }
+    return [username: parsed_args.username, action: changed ? 'updated' : 'unchanged', changed: changed]
 }
 
 def addUser(parsed_args) {
     security.addUser(parsed_args.username, parsed_args.first_name, parsed_args.last_name, parsed_args.email, true, parsed_args.password, parsed_args.roles)
     log.info("Created user {}", parsed_args.username)
+    return [username: parsed_args.username, action: 'created', changed: []]
 }
 
 def deleteUser(parsed_args) {
     try {
         security.securitySystem.deleteUser(parsed_args.username, UserManager.DEFAULT_SOURCE)
         log.info("Deleted user {}", parsed_args.username)
+        return [username: parsed_args.username, action: 'deleted', changed: []]
     } catch (UserNotFoundException ignored) {
         log.info("Delete user: user {} does not exist", parsed_args.username)
+        return [username: parsed_args.username, action: 'unchanged', changed: []]
     }
 }
 """
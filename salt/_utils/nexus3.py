@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Utility functions shared by the nexus3 states, execution modules and beacon
+
+Resolves the connection settings of the nexus3 configuration block and its
+profiles.  Coordinates the processes of a minion that talk to the same
+Nexus 3 host, for example parallel states, with lock files in the minion
+cachedir.
+Called through __utils__, i.e. __utils__['nexus3.script_slot'](__opts__, host, 4)
+"""
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+
+log = logging.getLogger(__name__)
+
+CONNECTION_DEFAULTS = {'host': 'http://127.0.0.1:8081',
+                       'user': 'admin',
+                       'pass': 'admin123'}
+
+
+def connection_info(options, profile=None):
+    """
+    Returns the host, user and pass used to connect to Nexus 3 from the nexus3
+    configuration block.  With a profile, the settings of that entry of
+    profiles are used and missing values fall back to the top level settings.
+    Raises ValueError if the profile is not configured
+    """
+    _options = dict(options or {})
+    if profile is not None:
+        profiles = _options.get('profiles', {})
+        if profile not in profiles:
+            raise ValueError('Nexus3 profile {0} is not configured'.format(profile))
+        _options.update(profiles[profile])
+
+    info = {}
+    default_attrs_used = []
+    for attr in CONNECTION_DEFAULTS:
+        if attr not in _options:
+            default_attrs_used.append(attr)
+        info[attr] = _options.get(attr, CONNECTION_DEFAULTS[attr])
+    if default_attrs_used:
+        log.info('Using default value for Nexus3: {0}'.format(default_attrs_used))
+    return info
+
+
+def host_id(host):
+    """
+    Returns a Nexus 3 host url in a form that is safe to use in file and cache names
+    """
+    return re.sub(r'[^A-Za-z0-9.-]', '_', host)
+
+
+def lock_path(opts, *parts):
+    """
+    Returns a path below the nexus3 directory of the minion cachedir,
+    creating the parent directory if needed
+    """
+    path = os.path.join(opts['cachedir'], 'nexus3', *parts)
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        if not os.path.isdir(os.path.dirname(path)):
+            raise
+    return path
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on a file.  The lock is shared by every
+    process and thread on the minion, including parallel states
+    """
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def script_slot(opts, host, limit):
+    """
+    Limits the number of scripts in flight against a Nexus 3 host to limit.
+    A free slot is one of limit lock files that no other process holds.
+    A limit of 0 or None disables the limit
+    """
+    if not limit:
+        yield
+        return
+
+    while True:
+        for slot in range(limit):
+            lock_file = open(lock_path(opts, 'slots', host_id(host), '{0}.lock'.format(slot)), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                lock_file.close()
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            return
+        time.sleep(0.05)
+
+
+def rate_limit(opts, host, rate, burst=None):
+    """
+    Blocks until a token is available in the token bucket of a Nexus 3 host.
+    The bucket refills with rate tokens per second up to burst tokens and is
+    kept in the minion cachedir, so every process on the minion draws from
+    the same bucket.  A rate of 0 or None disables the limit
+
+    Returns:
+        float: Seconds spent waiting for a token
+    """
+    if not rate:
+        return 0.0
+
+    burst = max(burst or rate, 1)
+    bucket_path = lock_path(opts, 'ratelimit', '{0}.json'.format(host_id(host)))
+    waited = 0.0
+    while True:
+        with file_lock('{0}.lock'.format(bucket_path)):
+            now = time.time()
+            try:
+                with open(bucket_path) as bucket_file:
+                    bucket = json.load(bucket_file)
+            except (IOError, OSError, ValueError):
+                bucket = {'tokens': burst, 'updated': now}
+
+            tokens = min(burst, bucket['tokens'] + max(now - bucket['updated'], 0) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / float(rate)
+
+            with open(bucket_path, 'w') as bucket_file:
+                json.dump({'tokens': tokens, 'updated': now}, bucket_file)
+
+        if not wait:
+            if waited:
+                log.debug('Waited {0:.2f}s for the Nexus3 rate limit of {1}'.format(waited, host))
+            return waited
+        time.sleep(wait)
+        waited += wait
+
+
+@contextlib.contextmanager
+def throttle(opts, host, options):
+    """
+    Applies the rate_limit, rate_burst and max_concurrency options of the
+    nexus3 configuration block to a single call to a Nexus 3 host
+    """
+    with script_slot(opts, host, options.get('max_concurrency', 4)):
+        rate_limit(opts, host, options.get('rate_limit'), options.get('rate_burst'))
+        yield